@@ -0,0 +1,71 @@
+# === FILE CACHE HELPERS ===
+# Atomic writes and content-keyed Parquet caches shared by every module.
+#
+# A file is written under a temporary name next to its final path and moved into place with
+# os.replace, so readers (and concurrently running stages) never see a half-written file. Parsed
+# sources are cached as data/cache/<name>/<name>-<digest>.parquet, where the digest covers the
+# names and content of the source files; a changed source simply gets a new cache file.
+#
+# Only the standard library is imported at module level; pandas is imported by cached_parquet.
+
+import contextlib
+import hashlib
+import json
+import os
+import threading
+from config import get_paths
+
+
+@contextlib.contextmanager
+def atomic_path(path, suffix=""):
+    """Yield a temporary path to write `path` through; it replaces `path` only if the block succeeds.
+
+    `suffix` is appended to the temporary name for writers that pick the format from the
+    extension (matplotlib's savefig).
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    # Per thread, so concurrent writers of the same path never share a temporary file
+    tmp = f"{path}.{threading.get_ident()}.tmp{suffix}"
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def write_bytes(path, data):
+    with atomic_path(path) as tmp:
+        with open(tmp, "wb") as f:
+            f.write(data)
+
+def write_json(path, data, **kwargs):
+    with atomic_path(path) as tmp:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, **kwargs)
+
+
+def source_digest(sources, salt=""):
+    """Short sha256 of the names and content of `sources`, plus `salt` for settings that change the result."""
+    digest = hashlib.sha256(salt.encode("utf-8"))
+    for source in sources:
+        digest.update(os.path.basename(source).encode("utf-8"))
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+def cache_path(name, sources, salt="", paths=None):
+    return (paths or get_paths()).cache_file(name, f"{name}-{source_digest(sources, salt)}.parquet")
+
+def cached_parquet(sources, name, build, salt="", paths=None):
+    """The DataFrame `build()` returns, computed once per version of `sources` and then read back."""
+    import pandas as pd
+    path = cache_path(name, sources, salt, paths)
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+    df = build()
+    with atomic_path(path) as tmp:
+        df.to_parquet(tmp, index=False)
+    return df
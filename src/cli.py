@@ -0,0 +1,229 @@
+# === COMMAND LINE ===
+# Single entry point for the project: `running-trends <command>`.
+#
+# Only the standard library and config are imported here. pandas, matplotlib, scipy and the
+# scrapers are imported inside the command that needs them, so `running-trends status` starts in
+# a few tens of milliseconds and is cheap enough for a cron health check:
+#
+#   running-trends status --budget-ms 300 || alert "running-trends unhealthy"
+
+import time
+
+STARTED = time.perf_counter()
+
+import argparse
+import datetime
+import json
+import os
+import sys
+from config import get_paths
+
+
+def cmd_scrape(args):
+    import extraction
+    years = range(args.from_year, args.to_year + 1)
+    provinces = args.provinces or extraction.PROVINCES
+    extraction.run_race_scraping(years=years, provinces=provinces, workers=args.workers, rate=args.rate,
+                                 incremental=not args.full, force=args.force, append=args.append)
+    if not args.skip_gdp:
+        extraction.scrape_gdp_data()
+
+def cmd_transform(args):
+    import municipalities
+    import series
+    import transformation
+    transformation.combine_runedia_races(source=args.source)
+    transformation.combine_socioeconomic_data()
+    transformation.combine_trends()
+    if os.path.exists(get_paths().raw_file(municipalities.MUNICIPALITY_LIST)):
+        municipalities.combine_municipalities()
+    else:
+        print(f"Skipping municipalities: no {municipalities.MUNICIPALITY_LIST} in {get_paths().raw}")
+    series.combine_series()
+
+def cmd_export(args):
+    import transformation
+    transformation.create_combined_powerbi_dataset()
+    transformation.build_race_cube(force=args.force)
+
+def cmd_stats(args):
+    import stats
+    results = stats.run_hypothesis_tests(n_resamples=args.resamples, seed=args.seed)
+    output_path = get_paths().processed_file("hypothesis_tests.csv")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    results.to_csv(output_path, index=False)
+    print(f"{len(results)} tests saved to: {output_path}")
+    if args.panel:
+        import panel
+        fits = panel.sweep(lags=range(args.max_lag + 1))
+        output_path = get_paths().processed_file("panel_regressions.csv")
+        fits.to_csv(output_path, index=False)
+        print(f"{len(fits)} panel coefficients saved to: {output_path}")
+
+def cmd_render(args):
+    import visualization
+    if args.report:
+        visualization.report_hypotheses()
+    visualization.render_charts(args.charts or None, force=args.force, workers=args.workers)
+
+def cmd_run(args):
+    import pipeline
+    result = pipeline.Pipeline(pipeline.STAGES).run(args.stages or None, force=args.force, workers=args.workers,
+                                                    profile=args.profile, trace_memory=args.trace_memory)
+    return 1 if "failed" in result.values() else 0
+
+
+# === status ===
+def describe_file(path):
+    if not os.path.exists(path):
+        return None
+    if os.path.isdir(path):
+        size = sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+    else:
+        size = os.path.getsize(path)
+    modified = datetime.datetime.fromtimestamp(os.path.getmtime(path))
+    return {"size": size, "modified": modified.isoformat(timespec="seconds")}
+
+def read_json(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def collect_status():
+    """What has been produced and when, from files and JSON state only (no pandas)."""
+    paths = get_paths()
+    outputs = {
+        "races_dataset": paths.processed_file("races_dataset.csv"),
+        "socioeconomic": paths.processed_file("running_trends_cleaned_for_powerbi.csv"),
+        "google_trends": paths.processed_file("google_trends.csv"),
+        "powerbi": paths.processed_file("powerbi_combined_dataset.csv"),
+        "race_cube": paths.processed_file("race_cube"),
+        "municipalities": paths.processed_file("races_by_municipality.csv"),
+        "race_series": paths.processed_file("race_series.csv"),
+        "hypothesis_tests": paths.processed_file("hypothesis_tests.csv"),
+        "panel_regressions": paths.processed_file("panel_regressions.csv"),
+    }
+    manifest = read_json(paths.raw_file("runedia", "manifest.json")) or {}
+    scrape = {}
+    for entry in manifest.values():
+        scrape[entry.get("status", "unknown")] = scrape.get(entry.get("status", "unknown"), 0) + 1
+    last_scrape = max((entry.get("fetched_at", "") for entry in manifest.values()), default=None)
+    stages = (read_json(paths.cache_file("pipeline", "state.json")) or {}).get("stages", {})
+    return {
+        "root": paths.root,
+        "outputs": {name: describe_file(path) for name, path in outputs.items()},
+        "partitions": scrape,
+        "last_scrape": last_scrape,
+        "stages": {name: entry.get("finished_at") for name, entry in sorted(stages.items())},
+    }
+
+def cmd_status(args):
+    status = collect_status()
+    missing = [name for name, info in status["outputs"].items() if info is None]
+    failed = status["partitions"].get("failed", 0)
+    elapsed_ms = (time.perf_counter() - STARTED) * 1000
+    status["elapsed_ms"] = round(elapsed_ms, 1)
+
+    if args.json:
+        print(json.dumps(status, indent=2, ensure_ascii=False))
+    else:
+        print(f"Data root: {status['root']}")
+        for name, info in status["outputs"].items():
+            print(f"  {name:18s} " + (f"{info['modified']}  {info['size'] / 1e6:8.2f} MB" if info else "missing"))
+        partitions = ", ".join(f"{count} {state}" for state, count in sorted(status["partitions"].items()))
+        print(f"Scraped partitions: {partitions or 'none'} (last fetch: {status['last_scrape'] or 'never'})")
+        for name, finished in status["stages"].items():
+            print(f"  stage {name:16s} last run {finished}")
+        print(f"Status collected in {elapsed_ms:.0f} ms")
+
+    # Non-zero exit codes let a health check act on the result
+    if args.budget_ms is not None and elapsed_ms > args.budget_ms:
+        print(f"Startup budget exceeded: {elapsed_ms:.0f} ms > {args.budget_ms} ms", file=sys.stderr)
+        return 3
+    if args.strict and (missing or failed):
+        return 2
+    return 0
+
+
+def add_measure_flags(parser, default):
+    parser.add_argument("--profile", action="store_true", default=default,
+                        help="save a cProfile dump (calling thread only) next to the run's metrics")
+    parser.add_argument("--trace-memory", action="store_true", default=default,
+                        help="also record tracemalloc peaks (slower)")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="running-trends", description="Running trends in Spain: data pipeline")
+    add_measure_flags(parser, default=False)
+    # Shared by the measured commands so the flags also work after the command name; SUPPRESS keeps
+    # a command that does not repeat them from resetting what was given before it
+    measured = argparse.ArgumentParser(add_help=False)
+    add_measure_flags(measured, default=argparse.SUPPRESS)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scrape = commands.add_parser("scrape", parents=[measured], help="scrape Runedia races and regional GDP")
+    scrape.add_argument("--from-year", type=int, default=2000, help="first year to scrape")
+    scrape.add_argument("--to-year", type=int, default=datetime.date.today().year + 1, help="last year to scrape")
+    scrape.add_argument("--provinces", nargs="+", help="Runedia region slugs (default: all)")
+    scrape.add_argument("--workers", type=int, default=8, help="partitions scraped at the same time")
+    scrape.add_argument("--rate", type=float, default=2.0, help="requests per second per host")
+    scrape.add_argument("--full", action="store_true", help="scrape every partition, not only stale ones")
+    scrape.add_argument("--force", action="store_true", help="also refresh closed years")
+    scrape.add_argument("--append", action="store_true", help="append new races to races_dataset.csv as partitions finish")
+    scrape.add_argument("--skip-gdp", action="store_true", help="do not scrape the GDP tables")
+    scrape.set_defaults(func=cmd_scrape)
+
+    transform = commands.add_parser("transform", parents=[measured], help="build the race and socioeconomic datasets")
+    transform.add_argument("--source", choices=["csv", "parquet"], default="csv", help="raw race storage to read")
+    transform.set_defaults(func=cmd_transform)
+
+    export = commands.add_parser("export", parents=[measured], help="write the Power BI dataset and the race cube")
+    export.add_argument("--force", action="store_true", help="rebuild every year of the cube")
+    export.set_defaults(func=cmd_export)
+
+    stats = commands.add_parser("stats", parents=[measured], help="run the correlation tests (and panel regressions)")
+    stats.add_argument("--resamples", type=int, default=10_000, help="permutation and bootstrap resamples")
+    stats.add_argument("--seed", type=int, default=0)
+    stats.add_argument("--panel", action="store_true", help="also fit the fixed-effects panel regressions")
+    stats.add_argument("--max-lag", type=int, default=2, help="largest lag for the panel regressions")
+    stats.set_defaults(func=cmd_stats)
+
+    render = commands.add_parser("render", parents=[measured], help="render the charts")
+    render.add_argument("charts", nargs="*", help="charts to render (default: all)")
+    render.add_argument("--force", action="store_true", help="redraw even if the inputs are unchanged")
+    render.add_argument("--workers", type=int, help="number of rendering processes")
+    render.add_argument("--report", action="store_true", help="also print the H1-H3 correlation checks")
+    render.set_defaults(func=cmd_render)
+
+    run = commands.add_parser("run", parents=[measured], help="run the cached pipeline (all stages by default)")
+    run.add_argument("stages", nargs="*")
+    run.add_argument("--force", action="store_true")
+    run.add_argument("--workers", type=int, default=4)
+    run.set_defaults(func=cmd_run)
+
+    status = commands.add_parser("status", help="show what has been produced; cheap enough for cron")
+    status.add_argument("--json", action="store_true", help="machine-readable output")
+    status.add_argument("--budget-ms", type=float, help="exit with 3 if startup and status took longer than this")
+    status.add_argument("--strict", action="store_true", help="exit with 2 if an output is missing or a partition failed")
+    status.set_defaults(func=cmd_status)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command in ("status", "run"):
+        # status must stay cheap; run measures each pipeline stage itself
+        return args.func(args) or 0
+    from instrumentation import Run
+    run = Run(args.command, profile=args.profile, trace_memory=args.trace_memory)
+    try:
+        with run.stage(args.command):
+            code = args.func(args) or 0
+    finally:
+        print(f"{args.command} finished; metrics saved to: {run.save()}")
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+# === PATH CONFIGURATION ===
+# Resolves the data, processed, image and cache roots used by every stage.
+#
+# Precedence, highest first:
+#   1. Environment variables (RUNNING_TRENDS_ROOT, RUNNING_TRENDS_DATA_DIR, RUNNING_TRENDS_RAW_DIR,
+#      RUNNING_TRENDS_PROCESSED_DIR, RUNNING_TRENDS_IMAGES_DIR, RUNNING_TRENDS_CACHE_DIR)
+#   2. The [paths] table of the config file: $RUNNING_TRENDS_CONFIG, or running-trends.toml at the repo root
+#   3. The repository layout (data/raw, data/processed, images, data/cache)
+#
+# Paths are resolved on every call, so pointing RUNNING_TRENDS_ROOT at a scratch directory gives a
+# process its own isolated copy of the pipeline (the config file is ignored in that case).
+
+import os
+from dataclasses import dataclass
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENV_PREFIX = "RUNNING_TRENDS_"
+KEYS = ["root", "data", "raw", "processed", "images", "cache"]
+
+
+@dataclass(frozen=True)
+class Paths:
+    root: str
+    data: str
+    raw: str
+    processed: str
+    images: str
+    cache: str
+
+    def raw_file(self, *parts):
+        return os.path.join(self.raw, *parts)
+
+    def processed_file(self, *parts):
+        return os.path.join(self.processed, *parts)
+
+    def image_file(self, *parts):
+        return os.path.join(self.images, *parts)
+
+    def cache_file(self, *parts):
+        return os.path.join(self.cache, *parts)
+
+
+def config_file():
+    return os.environ.get(f"{ENV_PREFIX}CONFIG", os.path.join(REPO_ROOT, "running-trends.toml"))
+
+def read_config(path):
+    if not os.path.exists(path):
+        return {}
+    import tomllib
+    with open(path, "rb") as f:
+        settings = tomllib.load(f).get("paths", {})
+    # Relative paths in the file are relative to the file itself
+    base = os.path.dirname(os.path.abspath(path))
+    return {key: os.path.join(base, value) for key, value in settings.items() if key in KEYS}
+
+def read_env():
+    names = {"root": "ROOT", "data": "DATA_DIR", "raw": "RAW_DIR", "processed": "PROCESSED_DIR",
+             "images": "IMAGES_DIR", "cache": "CACHE_DIR"}
+    return {key: os.path.abspath(os.environ[ENV_PREFIX + name])
+            for key, name in names.items() if os.environ.get(ENV_PREFIX + name)}
+
+def get_paths():
+    env = read_env()
+    # A root from the environment relocates everything, so the config file's paths are not used
+    settings = env if "root" in env else {**read_config(config_file()), **env}
+    root = settings.get("root", REPO_ROOT)
+    data = settings.get("data", os.path.join(root, "data"))
+    return Paths(
+        root=root,
+        data=data,
+        raw=settings.get("raw", os.path.join(data, "raw")),
+        processed=settings.get("processed", os.path.join(data, "processed")),
+        images=settings.get("images", os.path.join(root, "images")),
+        cache=settings.get("cache", os.path.join(data, "cache")),
+    )
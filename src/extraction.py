@@ -3,131 +3,557 @@
 
 import requests
 import pandas as pd
+import hashlib
+import importlib.util
+import json
 import os
+import random
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextvars
+import datetime
+from urllib.parse import urlparse
 from bs4 import BeautifulSoup
+from cache import write_json
+from config import get_paths
+from http_cache import get_session, response_cache
+from instrumentation import count_request, record
+from storage import PROVINCES, partition_path, read_race_file, read_races, write_race_partition
 
-# === SCRAPER FOR RUNEDIA ===
-def get_html(province, date, page):
-    url = f"https://runedia.mundodeportivo.com/calendario-carreras/espana/{province}/provincia/tipo/distancia/{date}/0/0/{page}/"
-    headers = {"User-Agent": "Mozilla/5.0"}
-    response = requests.get(url, headers=headers)
-    return response.text if response.status_code == 200 else None
+RUNEDIA_URL = "https://runedia.mundodeportivo.com"
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+RETRY_STATUS = {429, 500, 502, 503, 504}
 
-def parse_race_box(div, province):
-    try:
-        day = div.find("span", class_="dia").text.strip()
-        month = div.find("span", class_="mes").text.strip()
-    except:
-        day, month = None, None
+# "csv" keeps one carreras_{province}_{year}.csv per partition; "parquet" writes the
+# provincia/año partitioned dataset under data/raw/runedia_dataset instead
+RACE_STORAGE = "csv"
 
-    try:
-        title_tag = div.find("a", class_="nom-cursa")
-        title = title_tag.text.strip()
-        link = title_tag["href"]
-    except:
-        title, link = None, None
 
-    try:
-        location = div.find("span", class_="lloc").text.strip()
-    except:
-        location = None
+# === RATE LIMITING ===
+class TokenBucket:
+    """Thread-safe token bucket: `rate` requests per second, bursts up to `capacity`."""
 
-    try:
-        spans = div.find_all("span")
-        type_ = spans[-2].text.strip() if len(spans) >= 2 else None
-        distance = spans[-1].text.strip() if len(spans) >= 1 else None
-    except:
-        type_, distance = None, None
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """One token bucket per host, created on first use."""
+
+    def __init__(self, rate=2.0, capacity=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def configure(self, rate, capacity=None):
+        with self.lock:
+            self.rate = rate
+            self.capacity = capacity
+            self.buckets = {}
+
+    def acquire(self, url):
+        host = urlparse(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(self.rate, self.capacity)
+        bucket.acquire()
+
+
+rate_limiter = HostRateLimiter()
+
+def retry_delay(response, attempt, backoff):
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    return backoff * 2 ** attempt + random.uniform(0, backoff)
+
+def fetch(url, retries=4, backoff=1.0, timeout=30, use_cache=True):
+    """GET `url` through the shared session, the response cache and the per-host rate limiter.
+
+    Fresh cache entries are returned without a request; stale ones are revalidated with a
+    conditional GET. 429/5xx responses and connection errors are retried with backoff.
+    """
+    entry = response_cache.get(url) if use_cache else None
+    if response_cache.is_fresh(entry):
+        count_request(0, cached=True)
+        return response_cache.to_response(url, entry)
+    headers = {**HEADERS, **response_cache.conditional_headers(entry)}
+
+    response = None
+    for attempt in range(retries + 1):
+        rate_limiter.acquire(url)
+        try:
+            response = get_session().get(url, headers=headers, timeout=timeout)
+            count_request(len(response.content))
+        except requests.RequestException as e:
+            if attempt == retries:
+                print(f"Request failed for {url}: {e}")
+                return None
+            time.sleep(retry_delay(None, attempt, backoff))
+            continue
+        if response.status_code not in RETRY_STATUS or attempt == retries:
+            break
+        time.sleep(retry_delay(response, attempt, backoff))
+
+    if response.status_code == 304 and entry is not None:
+        return response_cache.revalidate(url, entry, response)
+    if response.status_code == 200 and use_cache:
+        return response_cache.store(url, response)
+    return response
+
+# === SCRAPER FOR RUNEDIA ===
+def get_html(province, date, page, base_url=RUNEDIA_URL):
+    url = f"{base_url}/calendario-carreras/espana/{province}/provincia/tipo/distancia/{date}/0/0/{page}/"
+    response = fetch(url)
+    if response is None:
+        raise requests.ConnectionError(f"No response from {url}")
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        raise requests.HTTPError(f"HTTP {response.status_code} for {url}")
+    return response.text
+
+# === RACE PARSERS ===
+# Every backend reduces a race box to its spans as (classes, text) in document order plus the
+# `a.nom-cursa` anchor as (text, href), and build_race turns that into the same output dict.
+def build_race(spans, anchor, province):
+    first_text = {}
+    for classes, text in spans:
+        for cls in classes:
+            first_text.setdefault(cls, text)
+    day, month = first_text.get("dia"), first_text.get("mes")
+    if day is None or month is None:
+        day, month = None, None
+    title, link = anchor if anchor is not None and anchor[1] is not None else (None, None)
+    location = first_text.get("lloc")
+    type_ = spans[-2][1] if len(spans) >= 2 else None
+    distance = spans[-1][1] if len(spans) >= 1 else None
 
     return {
         "dia": day,
         "mes": month,
         "titulo": title,
-        "enlace": f"https://runedia.mundodeportivo.com{link}" if link and link.startswith("/") else link,
+        "enlace": f"{RUNEDIA_URL}{link}" if link and link.startswith("/") else link,
         "localidad": location,
         "tipo": type_,
         "distancia": distance,
         "provincia": province
     }
 
-def scrape_races(province, year):
+def parse_race_box(div, province):
+    spans = [(span.get("class") or [], span.get_text().strip()) for span in div.find_all("span")]
+    title_tag = div.find("a", class_="nom-cursa")
+    anchor = (title_tag.get_text().strip(), title_tag.get("href")) if title_tag is not None else None
+    return build_race(spans, anchor, province)
+
+def parse_races_bs4(html, province):
+    soup = BeautifulSoup(html, "html.parser")
+    return [parse_race_box(box, province) for box in soup.find_all("div", class_="item-cursa")]
+
+def parse_races_lxml(html, province):
+    import lxml.html
+    doc = lxml.html.fromstring(html)
+    races = []
+    for box in doc.xpath('//div[contains(concat(" ", normalize-space(@class), " "), " item-cursa ")]'):
+        spans = [(span.get("class", "").split(), span.text_content().strip()) for span in box.iter("span")]
+        anchor = None
+        for a in box.iter("a"):
+            if "nom-cursa" in a.get("class", "").split():
+                anchor = (a.text_content().strip(), a.get("href"))
+                break
+        races.append(build_race(spans, anchor, province))
+    return races
+
+def parse_races_selectolax(html, province):
+    from selectolax.lexbor import LexborHTMLParser
     races = []
-    page = 1
+    for box in LexborHTMLParser(html).css("div.item-cursa"):
+        spans = [((span.attributes.get("class") or "").split(), span.text(deep=True).strip()) for span in box.css("span")]
+        title_tag = box.css_first("a.nom-cursa")
+        anchor = (title_tag.text(deep=True).strip(), title_tag.attributes.get("href")) if title_tag is not None else None
+        races.append(build_race(spans, anchor, province))
+    return races
+
+PARSERS = {
+    "bs4": parse_races_bs4,
+    "lxml": parse_races_lxml,
+    "selectolax": parse_races_selectolax,
+}
+PARSER_BACKEND = None  # None uses the fastest backend that is installed
+
+def available_parsers():
+    return [name for name, module in [("selectolax", "selectolax"), ("lxml", "lxml"), ("bs4", "bs4")]
+            if importlib.util.find_spec(module) is not None]
+
+def parse_races(html, province, backend=None):
+    backend = backend or PARSER_BACKEND or available_parsers()[0]
+    return PARSERS[backend](html, province)
+
+def benchmark_parsers(corpus_dir=None, backends=None, repeat=3):
+    """Parse every saved Runedia page in `corpus_dir` with each backend and report pages/sec.
+
+    The corpus is either a folder of .html files or the HTTP response cache. Each backend's
+    output is checked against the plain BeautifulSoup parser.
+    """
+    corpus_dir = corpus_dir or response_cache.path
+    pages = []
+    for root, _, files in os.walk(corpus_dir):
+        for file in files:
+            if file.endswith((".html", ".body")):
+                with open(os.path.join(root, file), "rb") as f:
+                    content = f.read()
+                if b"item-cursa" in content:
+                    pages.append(content.decode("utf-8", errors="replace"))
+    if not pages:
+        print(f"No Runedia pages found in {corpus_dir}")
+        return pd.DataFrame()
+
+    reference = [parse_races_bs4(html, "") for html in pages]
+    results = []
+    for backend in backends or available_parsers():
+        parser = PARSERS[backend]
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = [parser(html, "") for html in pages]
+            best = min(best, time.perf_counter() - start)
+        results.append({
+            "backend": backend,
+            "pages": len(pages),
+            "seconds": round(best, 4),
+            "pages_per_sec": round(len(pages) / best, 1),
+            "identical": output == reference,
+        })
+    df = pd.DataFrame(results).sort_values("pages_per_sec", ascending=False)
+    print(df.to_string(index=False))
+    return df
+
+def iter_race_pages(province, year, start_page=1, base_url=RUNEDIA_URL, max_pages=1000):
+    """Yield `(page, races)` for every results page of a partition, in order.
+
+    Stops at the first page without race boxes, at a 404, or when a page repeats the previous
+    one, which guards against out-of-range page numbers being clamped to the last page.
+    """
     date = f"{year}-01"
-    while True:
-        print(f"Scraping page {page} of {province} in {year}...")
-        html = get_html(province, date, page)
+    previous = None
+    for page in range(start_page, max_pages + 1):
+        html = get_html(province, date, page, base_url)
         if html is None:
-            break
-        soup = BeautifulSoup(html, "html.parser")
-        boxes = soup.find_all("div", class_="item-cursa")
-        if not boxes:
-            break
-        races += [parse_race_box(box, province) for box in boxes]
-        if len(races) > 500:
-            break
-        page += 1
-        time.sleep(1)
+            return
+        races = parse_races(html, province)
+        if not races:
+            return
+        links = [race["enlace"] for race in races]
+        if links == previous:
+            return
+        previous = links
+        yield page, races
+
+def checkpoint_path(province, year):
+    return get_paths().raw_file("runedia", ".checkpoints", f"{province}_{year}.json")
+
+def read_checkpoint(province, year):
+    try:
+        with open(checkpoint_path(province, year), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_checkpoint(province, year, state):
+    write_json(checkpoint_path(province, year), state)
+
+def scrape_races(province, year, base_url=RUNEDIA_URL, chunk_pages=5):
+    """Stream a partition to disk and return the number of races written.
+
+    Races are appended to `<file>.partial` every `chunk_pages` pages and a checkpoint records
+    the last page written and the file size at that point. If a previous run was interrupted,
+    the partial file is cut back to the checkpoint and scraping resumes on the next page.
+    The finished file replaces the previous one in a single rename, or is converted into
+    the Parquet dataset when RACE_STORAGE is "parquet".
+    """
+    partial = f"{race_csv_path(province, year)}.partial"
+    os.makedirs(os.path.dirname(partial), exist_ok=True)
+
+    state = read_checkpoint(province, year)
+    if state and os.path.exists(partial):
+        print(f"Resuming {province} {year} after page {state['page']}")
+        f = open(partial, "r+b")
+        f.truncate(state["bytes"])
+        f.seek(state["bytes"])
+    else:
+        state = {"page": 0, "rows": 0, "bytes": 0}
+        f = open(partial, "wb")
+
+    with f:
+        chunk = []
+        pages = 0
+        for page, races in iter_race_pages(province, year, state["page"] + 1, base_url):
+            record(pages=1)
+            chunk += races
+            pages += 1
+            if pages % chunk_pages == 0:
+                state = write_race_chunk(f, chunk, province, year, page, state)
+                chunk = []
+        if chunk:
+            state = write_race_chunk(f, chunk, province, year, page, state)
+
+    if state["rows"] == 0:
+        os.remove(partial)
+    elif RACE_STORAGE == "parquet":
+        save_race_data(pd.read_csv(partial, dtype=str), province, year)
+        os.remove(partial)
+    else:
+        path = race_data_path(province, year)
+        os.replace(partial, path)
+        print(f"Saved: {path}")
+    try:
+        os.remove(checkpoint_path(province, year))
+    except OSError:
+        pass
+    return state["rows"]
+
+def write_race_chunk(f, races, province, year, page, state):
     df = pd.DataFrame(races)
-    if not df.empty:
-        df["año"] = year
-    return df
+    df["año"] = year
+    df.to_csv(f, header=state["bytes"] == 0, index=False, encoding="utf-8")
+    f.flush()
+    state = {"page": page, "rows": state["rows"] + len(df), "bytes": f.tell()}
+    write_checkpoint(province, year, state)
+    return state
+
+def race_csv_path(province, year):
+    return get_paths().raw_file("runedia", f"carreras_{province}_{year}.csv")
+
+def race_dataset_path():
+    return get_paths().raw_file("runedia_dataset")
+
+def race_data_path(province, year):
+    if RACE_STORAGE == "parquet":
+        return partition_path(race_dataset_path(), province, year)
+    return race_csv_path(province, year)
 
 def save_race_data(df, province, year):
-    path = f"data/raw/runedia/carreras_{province}_{year}.csv"
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    df.to_csv(path, index=False)
+    if RACE_STORAGE == "parquet":
+        path = write_race_partition(df, race_dataset_path(), province, year)
+    else:
+        path = race_data_path(province, year)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_csv(path, index=False)
     print(f"Saved: {path}")
 
-def run_race_scraping():
-    provinces = [
-        "andalucia", "navarra", "asturias", "aragon", "canarias", "cantabria",
-        "castilla-la-mancha", "castilla-y-leon", "catalunya", "ceuta", "euskadi",
-        "extremadura", "galicia", "illes-balears", "la-rioja", "madrid", "melilla",
-        "murcia", "valencia"
-    ]
-    for year in range(2000, 2026):
+# === PARTITION MANIFEST ===
+class PartitionManifest:
+    """JSON record of every scraped (province, year) partition: fetch time, rows, content hash and status."""
+
+    def __init__(self, path=None):
+        self.path = path or get_paths().raw_file("runedia", "manifest.json")
+        self.lock = threading.Lock()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def key(province, year):
+        return f"{province}/{year}"
+
+    def get(self, province, year):
+        return self.entries.get(self.key(province, year))
+
+    def record(self, province, year, status, rows=0, sha256=None, error=None, fetched_at=None):
+        fetched_at = fetched_at or datetime.datetime.now()
+        entry = {
+            "fetched_at": fetched_at.isoformat(timespec="seconds"),
+            # A partition is closed once it was fetched after its year ended
+            "closed": year < fetched_at.year,
+            "status": status,
+            "rows": rows,
+            "sha256": sha256,
+        }
+        if error:
+            entry["error"] = error
+        with self.lock:
+            self.entries[self.key(province, year)] = entry
+            self.save()
+
+    def save(self):
+        write_json(self.path, self.entries, indent=1, sort_keys=True)
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def count_rows(path):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    return len(pd.read_csv(path, usecols=[0]))
+
+def plan_partitions(years, provinces, manifest, force=False):
+    """Pick the partitions that still need scraping.
+
+    Partitions fetched after their year ended are closed and skipped, unless `force` is set. The
+    current and next year are always refreshed, failed partitions are retried, and past years last
+    fetched while they were still running are fetched once more. Partitions saved before the
+    manifest existed are registered from their file, dated by its modification time.
+    """
+    current_year = datetime.date.today().year
+    todo = []
+    for year in years:
         for province in provinces:
-            df = scrape_races(province, year)
-            if not df.empty:
-                save_race_data(df, province, year)
+            if force or year >= current_year:
+                todo.append((province, year))
+                continue
+            entry = manifest.get(province, year)
+            if entry is None:
+                path = race_data_path(province, year)
+                if os.path.exists(path):
+                    modified = datetime.datetime.fromtimestamp(os.path.getmtime(path))
+                    manifest.record(province, year, "ok", count_rows(path), file_sha256(path), fetched_at=modified)
+                    entry = manifest.get(province, year)
+                else:
+                    todo.append((province, year))
+                    continue
+            # Entries written before the flag existed are dated by their fetch time
+            closed = entry.get("closed", int(entry["fetched_at"][:4]) > year)
+            if entry["status"] == "failed" or not closed:
+                todo.append((province, year))
+    return todo
+
+def read_race_data(province, year):
+    if RACE_STORAGE == "parquet":
+        return read_races(race_dataset_path(), provinces=[province], years=[year])
+    df, reason = read_race_file(race_data_path(province, year))
+    if df is None:
+        raise ValueError(f"{race_data_path(province, year)} was rejected: {reason}")
+    return df
+
+def scrape_partition(province, year, manifest, base_url=RUNEDIA_URL, append=False):
+    try:
+        rows = scrape_races(province, year, base_url)
+    except Exception as e:
+        manifest.record(province, year, "failed", error=str(e))
+        raise
+    if rows == 0:
+        manifest.record(province, year, "empty")
+        return 0
+    manifest.record(province, year, "ok", rows, file_sha256(race_data_path(province, year)))
+    if append:
+        from transformation import append_race_partition
+        append_race_partition(read_race_data(province, year))
+    return rows
+
+def run_race_scraping(years=None, provinces=PROVINCES, workers=8, rate=2.0, base_url=RUNEDIA_URL, incremental=True, force=False,
+                      append=False):
+    """Scrape (province, year) partitions on a pool of `workers` threads.
+
+    Pages of one partition are still fetched in order, but partitions run side by side and
+    all of them share the per-host limit of `rate` requests per second. With `incremental`
+    only the partitions chosen by `plan_partitions` are fetched; otherwise every one is. With
+    `append` the new races of each partition are added to races_dataset.csv as soon as it is
+    saved (see transformation.append_race_partition) instead of waiting for a full rebuild.
+    """
+    if years is None:
+        years = range(2000, datetime.date.today().year + 2)
+    manifest = PartitionManifest()
+    if incremental:
+        partitions = plan_partitions(years, provinces, manifest, force)
+    else:
+        partitions = [(province, year) for year in years for province in provinces]
+    print(f"Scraping {len(partitions)} of {len(years) * len(provinces)} partitions")
+
+    rate_limiter.configure(rate)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            # Each worker runs in a copy of this context, so its record() calls reach the running stage
+            pool.submit(contextvars.copy_context().run, scrape_partition, province, year, manifest, base_url,
+                        append): (province, year)
+            for province, year in partitions
+        }
+        for future in as_completed(futures):
+            province, year = futures[future]
+            try:
+                record(rows_out=future.result())
+            except Exception as e:
+                print(f"Error scraping {province} {year}: {e}")
 
 # === SCRAPER FOR GDP (DATOSMACRO) ===
-def scrape_gdp_data():
-    total_data = {"PIB_anual": {}, "PIB_capita": {}}
-    for year in range(2000, 2025):
-        url = f"https://datosmacro.expansion.com/pib/espana-comunidades-autonomas?anio={year}"
-        response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
-        soup = BeautifulSoup(response.content, "html.parser")
-        tables = soup.find_all("table")
-
-        if len(tables) > 0:
-            for row in tables[0].find_all("tr")[1:]:
-                cols = row.find_all("td")
-                if len(cols) > 1:
-                    comunidad = cols[0].text.strip()
-                    pib_anual = cols[2].text.strip()
-                    total_data["PIB_anual"].setdefault(year, []).append({"CCAA": comunidad, "PIB_anual": pib_anual})
-
-        if len(tables) > 1:
-            for row in tables[1].find_all("tr")[1:]:
-                cols = row.find_all("td")
-                if len(cols) > 1:
-                    comunidad = cols[0].text.strip()
-                    pib_capita = cols[2].text.strip()
-                    total_data["PIB_capita"].setdefault(year, []).append({"CCAA": comunidad, "PIB_capita": pib_capita})
-
-    df_anual = pd.DataFrame([{"Año": y, **entry} for y, data in total_data["PIB_anual"].items() for entry in data])
-    df_capita = pd.DataFrame([{"Año": y, **entry} for y, data in total_data["PIB_capita"].items() for entry in data])
-    df_gdp = pd.merge(df_anual, df_capita, on=["Año", "CCAA"], how="outer")
-
-    output_path = "data/processed/gdp_dataset.csv"
+GDP_URL = "https://datosmacro.expansion.com/pib/espana-comunidades-autonomas?anio={year}"
+# The first table on the page holds annual GDP, the second GDP per capita; each has the value in
+# its third column and the year-on-year change (%) in the fourth
+GDP_TABLES = [("PIB_anual", "PIB_anual_var"), ("PIB_capita", "PIB_capita_var")]
+GDP_COLUMNS = ["Año", "CCAA", "PIB_anual", "PIB_anual_var", "PIB_capita", "PIB_capita_var"]
+
+def parse_gdp_tables(html, year):
+    """Read both GDP tables of a datosmacro page in one pass: one record per region, with raw cell text."""
+    import lxml.html
+    doc = lxml.html.fromstring(html)
+    records = {}
+    for table, (value_col, change_col) in zip(doc.xpath("//table"), GDP_TABLES):
+        for row in table.xpath(".//tr[td]"):
+            cells = [td.text_content().strip() for td in row.xpath("./td")]
+            if len(cells) < 3:
+                continue
+            record = records.setdefault(cells[0], {"Año": year, "CCAA": cells[0]})
+            record[value_col] = cells[2]
+            if len(cells) > 3:
+                record[change_col] = cells[3]
+    return list(records.values())
+
+def scrape_gdp_data(years=range(2000, 2025)):
+    """Scrape regional GDP and save it typed: one row per (Año, CCAA) with canonical region keys,
+    PIB_anual in M€, PIB_capita in € and the year-on-year changes in %."""
+    from transformation import ccaa_key, spanish_number
+    records = []
+    for year in years:
+        response = fetch(GDP_URL.format(year=year))
+        if response is None or response.status_code != 200:
+            continue
+        records.extend(parse_gdp_tables(response.content, year))
+    if not records:
+        print("No GDP page could be fetched; keeping the existing GDP dataset")
+        return
+
+    df_gdp = pd.DataFrame(records).reindex(columns=GDP_COLUMNS)
+    for col in GDP_COLUMNS[2:]:
+        df_gdp[col] = spanish_number(df_gdp[col])
+    df_gdp["CCAA"] = ccaa_key(df_gdp["CCAA"])
+    df_gdp = df_gdp.dropna(subset=["CCAA"])
+    record(rows_in=len(records), rows_out=len(df_gdp))
+
+    output_path = get_paths().processed_file("gdp_dataset.csv")
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     df_gdp.to_csv(output_path, index=False, sep=";")
     print(f"GDP dataset saved to: {output_path}")
 
 # === MAIN RUN ===
 if __name__ == "__main__":
-    run_race_scraping()
-    scrape_gdp_data()
+    if sys.argv[1:2] == ["benchmark"]:
+        benchmark_parsers(*sys.argv[2:3])
+    else:
+        run_race_scraping()
+        scrape_gdp_data()
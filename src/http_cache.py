@@ -0,0 +1,172 @@
+# === HTTP SESSION AND RESPONSE CACHE ===
+# Shared keep-alive session for every scraper plus an on-disk cache of responses keyed by URL
+
+import hashlib
+import json
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from cache import write_bytes
+from config import get_paths
+
+CACHE_TTL = 24 * 3600
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session(pool_size=16):
+    """Return the process-wide session, so repeated requests to a host reuse its connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+    return _session
+
+
+class CachedResponse:
+    """The parts of a `requests.Response` the scrapers use, rebuilt from the cache."""
+
+    def __init__(self, url, status_code, content, encoding, from_cache=True):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+
+class ResponseCache:
+    """Stores 200 responses on disk with their ETag/Last-Modified validators.
+
+    Entries younger than `ttl` seconds are served without touching the network; older ones are
+    revalidated with a conditional GET. When the cache grows past `max_bytes` the least recently
+    used entries are evicted.
+    """
+
+    def __init__(self, path=None, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        self._path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = None
+        self.lock = threading.Lock()
+
+    @property
+    def path(self):
+        # Resolved on use so a relocated data root also relocates the cache
+        return self._path or get_paths().cache_file("http")
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        folder = os.path.join(self.path, key[:2])
+        return os.path.join(folder, f"{key}.body"), os.path.join(folder, f"{key}.json")
+
+    def get(self, url):
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                meta["content"] = f.read()
+        except (OSError, ValueError):
+            return None
+        os.utime(meta_path)
+        return meta
+
+    def is_fresh(self, entry):
+        return entry is not None and time.time() - entry["fetched_at"] < self.ttl
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def to_response(self, url, entry):
+        return CachedResponse(url, 200, entry["content"], entry.get("encoding"))
+
+    def store(self, url, response):
+        body_path, meta_path = self._paths(url)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        content = response.content
+        meta = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "encoding": response.encoding or response.apparent_encoding,
+            "fetched_at": time.time(),
+            "size": len(content),
+        }
+        previous = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+        write_bytes(body_path, content)
+        write_bytes(meta_path, json.dumps(meta).encode("utf-8"))
+        self._grow(len(content) - previous)
+        return CachedResponse(url, 200, content, meta["encoding"], from_cache=False)
+
+    def revalidate(self, url, entry, response):
+        """Record a 304: the cached body is still current, so only the timestamps move."""
+        _, meta_path = self._paths(url)
+        meta = {k: v for k, v in entry.items() if k != "content"}
+        meta["fetched_at"] = time.time()
+        meta["etag"] = response.headers.get("ETag") or meta.get("etag")
+        meta["last_modified"] = response.headers.get("Last-Modified") or meta.get("last_modified")
+        write_bytes(meta_path, json.dumps(meta).encode("utf-8"))
+        return self.to_response(url, entry)
+
+    def _entries(self):
+        for root, _, files in os.walk(self.path):
+            for file in files:
+                if file.endswith(".body"):
+                    body_path = os.path.join(root, file)
+                    meta_path = body_path[:-len(".body")] + ".json"
+                    try:
+                        yield body_path, meta_path, os.path.getsize(body_path), os.path.getmtime(meta_path)
+                    except OSError:
+                        continue
+
+    def _grow(self, delta):
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, _, size, _ in self._entries())
+            else:
+                self.size += delta
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Least recently used first; stop once comfortably below the limit
+        target = self.max_bytes * 0.9
+        for body_path, meta_path, size, _ in sorted(self._entries(), key=lambda e: e[3]):
+            if self.size <= target:
+                break
+            for path in (body_path, meta_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.size -= size
+
+    def clear(self):
+        with self.lock:
+            for body_path, meta_path, _, _ in list(self._entries()):
+                for path in (body_path, meta_path):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            self.size = 0
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,184 @@
+# === INSTRUMENTATION ===
+# Per-stage timings, memory high-water marks and counters, written to one JSON file per run:
+#
+#   data/cache/metrics/<run id>/metrics.json
+#   data/cache/metrics/<run id>/<stage>.prof      (with --profile; open with `python -m pstats`)
+#
+# Every pipeline stage and every `running-trends` command is measured: wall time, CPU time of the
+# process and of its worker processes, memory, rows read and written (reported by the code with
+# `record`) and HTTP requests and bytes (reported by extraction.fetch). Only the standard library
+# is imported, so the CLI stays fast to start.
+#
+# Memory of a stage is sampled while it runs: `rss_start_mb`, `rss_peak_mb` and their difference
+# `rss_growth_mb`. The kernel's high-water marks are kept as `lifetime_peak_rss_mb` (this process)
+# and `children_lifetime_peak_rss_mb` (its largest finished worker process); both only ever grow
+# over a run, so they say nothing about the stage itself.
+#
+# RSS, CPU and HTTP counters are process-wide. When stages run at the same time (the pipeline
+# runs independent stages in threads) they include the work of the stages listed in `overlapped`.
+# cProfile only sees the thread that entered the stage: work a stage hands to its own thread
+# pool (the scrape workers) shows up as time spent waiting on the futures.
+
+import contextlib
+import contextvars
+import cProfile
+import datetime
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from cache import write_json
+from config import get_paths
+
+CURRENT = contextvars.ContextVar("instrumentation_stage", default=None)
+
+_lock = threading.Lock()
+_http = {"http_requests": 0, "http_bytes": 0, "http_cached": 0}
+
+
+def count_request(nbytes, cached=False):
+    """Called for every HTTP response: a request that went to the network, or a cache hit."""
+    with _lock:
+        if cached:
+            _http["http_cached"] += 1
+        else:
+            _http["http_requests"] += 1
+            _http["http_bytes"] += nbytes
+
+def record(**counts):
+    """Add counts (rows_in=..., rows_out=...) to the stage running in this thread; no-op outside one."""
+    metrics = CURRENT.get()
+    if metrics is not None:
+        with _lock:
+            for key, value in counts.items():
+                metrics[key] = metrics.get(key, 0) + int(value)
+
+def lifetime_peak_rss_mb():
+    """High-water RSS since start of this process and of its largest finished child, in MB (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 / 1024 ** 2 if sys.platform == "darwin" else 1 / 1024
+    return (round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit, 1),
+            round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit, 1))
+
+def current_rss_mb():
+    """Resident set size of this process now, in MB (None without /proc)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        return None
+
+class RssSampler:
+    """Samples the current RSS on a daemon thread every `interval` seconds to find a stage's peak."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.start = self.peak = current_rss_mb()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        if self.start is not None:
+            self.thread.start()
+
+    def sample(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb() or 0)
+
+    def stop(self):
+        """(start, peak, growth) in MB, or Nones where RSS cannot be read."""
+        self.done.set()
+        if self.start is None:
+            return None, None, None
+        self.thread.join()
+        self.peak = max(self.peak, current_rss_mb() or 0)
+        return round(self.start, 1), round(self.peak, 1), round(self.peak - self.start, 1)
+
+
+class Run:
+    """One run of the pipeline or of a command; stages are measured with `with run.stage(name):`."""
+
+    def __init__(self, name, profile=False, trace_memory=False):
+        self.name = name
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.started_at = datetime.datetime.now()
+        self.id = f"{self.started_at:%Y%m%d-%H%M%S}-{name}-{os.getpid()}"
+        self.folder = get_paths().cache_file("metrics", self.id)
+        self.stages = []
+        self.active = set()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        metrics = {"stage": name, "started_at": datetime.datetime.now().isoformat(timespec="seconds")}
+        token = CURRENT.set(metrics)
+        with _lock:
+            http_before = dict(_http)
+            metrics["overlapped"] = sorted(self.active)
+            self.active.add(name)
+        if self.trace_memory:
+            # tracemalloc slows allocation down a lot, so it is opt-in; the peak is process-wide
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        profiler = cProfile.Profile() if self.profile else None
+        sampler = RssSampler()
+        cpu_before = os.times()
+        wall_before = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield metrics
+            metrics["status"] = "done"
+        except BaseException as e:
+            metrics["status"] = f"failed: {e!r}"
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+            wall = time.perf_counter() - wall_before
+            cpu_after = os.times()
+            metrics["wall_s"] = round(wall, 3)
+            metrics["cpu_s"] = round(cpu_after.user + cpu_after.system - cpu_before.user - cpu_before.system, 3)
+            metrics["children_cpu_s"] = round(cpu_after.children_user + cpu_after.children_system
+                                              - cpu_before.children_user - cpu_before.children_system, 3)
+            metrics["rss_start_mb"], metrics["rss_peak_mb"], metrics["rss_growth_mb"] = sampler.stop()
+            metrics["lifetime_peak_rss_mb"], metrics["children_lifetime_peak_rss_mb"] = lifetime_peak_rss_mb()
+            if self.trace_memory:
+                metrics["tracemalloc_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+            with _lock:
+                metrics.update({key: value - http_before[key] for key, value in _http.items()})
+                metrics["overlapped"] = sorted(set(metrics["overlapped"]) | (self.active - {name}))
+                self.active.discard(name)
+                self.stages.append(metrics)
+            if profiler:
+                os.makedirs(self.folder, exist_ok=True)
+                metrics["profile"] = os.path.join(self.folder, f"{name}.prof")
+                profiler.dump_stats(metrics["profile"])
+            CURRENT.reset(token)
+
+    def save(self):
+        """Write metrics.json for the run and return its path."""
+        os.makedirs(self.folder, exist_ok=True)
+        path = os.path.join(self.folder, "metrics.json")
+        report = {
+            "run": self.id,
+            "name": self.name,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "wall_s": round((datetime.datetime.now() - self.started_at).total_seconds(), 3),
+            "stages": sorted(self.stages, key=lambda stage: stage["started_at"]),
+        }
+        write_json(path, report, indent=2, ensure_ascii=False)
+        return path
+
+    def summary(self):
+        lines = [f"{'stage':22s} {'wall s':>8s} {'cpu s':>8s} {'peak MB':>8s} {'+MB':>7s} {'rows in':>9s} {'rows out':>9s} {'http':>6s}"]
+        for m in self.stages:
+            lines.append(f"{m['stage']:22s} {m['wall_s']:8.2f} {m['cpu_s'] + m['children_cpu_s']:8.2f} "
+                         f"{m['rss_peak_mb'] or 0:8.0f} {m['rss_growth_mb'] or 0:7.0f} "
+                         f"{m.get('rows_in', ''):>9} {m.get('rows_out', ''):>9} "
+                         f"{m['http_requests']:>6}")
+        return "\n".join(lines)
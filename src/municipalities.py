@@ -0,0 +1,197 @@
+# === MUNICIPALITIES ===
+# Resolves the free-text `localidad` of every race ("Cádiz, Chipiona (Cádiz)") to an INE province
+# and municipality code, using the INE municipality list saved as data/raw/municipios-INE.csv
+# (the CODAUTO;CPRO;CMUN;DC;NOMBRE export of the yearly "Relación de municipios").
+#
+# Names are reduced to a key of sorted, accent-free tokens without articles, so "Burgo, El",
+# "El Burgo" and "EL BURGO." hash to the same entry. Names that still miss are matched by
+# trigram similarity against the municipalities of the same province only, through an inverted
+# trigram index, so no pair of names is ever compared outside a shortlist. Every distinct
+# localidad is resolved once and the result is kept in a cache next to the list it came from.
+#
+#   python src/municipalities.py      # writes data/processed/races_by_municipality.csv
+
+import os
+import re
+import unicodedata
+from collections import Counter, defaultdict
+import pandas as pd
+from cache import atomic_path, cache_path
+from config import get_paths
+from instrumentation import record
+
+MUNICIPALITY_LIST = "municipios-INE.csv"
+# Smallest Dice coefficient between trigram sets accepted as a fuzzy match
+MIN_SIMILARITY = 0.75
+STOPWORDS = {"a", "d", "de", "del", "el", "els", "es", "i", "l", "la", "las", "les", "lo", "los", "o", "s", "sa", "y"}
+
+PROVINCES = {
+    "01": "Araba/Álava", "02": "Albacete", "03": "Alicante/Alacant", "04": "Almería", "05": "Ávila",
+    "06": "Badajoz", "07": "Balears, Illes", "08": "Barcelona", "09": "Burgos", "10": "Cáceres",
+    "11": "Cádiz", "12": "Castellón/Castelló", "13": "Ciudad Real", "14": "Córdoba", "15": "Coruña, A",
+    "16": "Cuenca", "17": "Girona", "18": "Granada", "19": "Guadalajara", "20": "Gipuzkoa",
+    "21": "Huelva", "22": "Huesca", "23": "Jaén", "24": "León", "25": "Lleida", "26": "Rioja, La",
+    "27": "Lugo", "28": "Madrid", "29": "Málaga", "30": "Murcia", "31": "Navarra", "32": "Ourense",
+    "33": "Asturias", "34": "Palencia", "35": "Palmas, Las", "36": "Pontevedra", "37": "Salamanca",
+    "38": "Santa Cruz de Tenerife", "39": "Cantabria", "40": "Segovia", "41": "Sevilla", "42": "Soria",
+    "43": "Tarragona", "44": "Teruel", "45": "Toledo", "46": "Valencia/València", "47": "Valladolid",
+    "48": "Bizkaia", "49": "Zamora", "50": "Zaragoza", "51": "Ceuta", "52": "Melilla",
+}
+# Runedia names provinces in Spanish, in the regional language or by island
+PROVINCE_ALIASES = {
+    "Vizcaya": "48", "Guipuzkoa": "20", "Guipúzcoa": "20", "Navarra": "31", "Tenerife": "38",
+    "La Palma": "38", "La Gomera": "38", "Hierro": "38", "El Hierro": "38", "Gran Canaria": "35",
+    "Lanzarote": "35", "Fuerteventura": "35", "Mallorca": "07", "Menorca": "07", "Ibiza": "07",
+    "Eivissa": "07", "Formentera": "07", "Gerona": "17", "Lérida": "25", "Orense": "32",
+}
+
+
+def name_variants(name):
+    """The names a place goes by: "Valencia/València" and "Zaidin/Saidí" are two names each."""
+    return [part.strip() for part in name.split("/") if part.strip()]
+
+def name_key(name):
+    """Sorted, accent-free tokens without articles; INE's "Rozas de Madrid, Las" == "Las Rozas de Madrid"."""
+    text = unicodedata.normalize("NFD", name.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    tokens = re.findall(r"[a-z0-9]+", text)
+    words = [token for token in tokens if token not in STOPWORDS] or tokens
+    return " ".join(sorted(words))
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+PROVINCE_CODES = {name_key(variant): code for code, name in PROVINCES.items() for variant in name_variants(name)}
+PROVINCE_CODES.update({name_key(name): code for name, code in PROVINCE_ALIASES.items()})
+
+
+def read_municipalities(path):
+    """The INE list as (cpro, cmun, municipio) with 2- and 5-digit codes; the title rows above the header are skipped."""
+    with open(path, encoding="utf-8-sig") as f:
+        header_row = next(i for i, line in enumerate(f) if "CPRO" in line.upper())
+    df = pd.read_csv(path, sep=None, engine="python", skiprows=header_row, dtype=str, encoding="utf-8-sig")
+    df.columns = [col.strip().upper() for col in df.columns]
+    cpro = df["CPRO"].str.strip().str.zfill(2)
+    return pd.DataFrame({
+        "cpro": cpro,
+        "cmun": cpro + df["CMUN"].str.strip().str.zfill(3),
+        "municipio": df["NOMBRE"].str.strip(),
+    })
+
+
+class MunicipalityIndex:
+    """Exact lookups by (province, name key) plus a per-province trigram index for the misses."""
+
+    def __init__(self, municipalities):
+        self.names = dict(zip(municipalities["cmun"], municipalities["municipio"]))
+        self.exact = {}
+        self.nationwide = {}
+        self.keys = {}
+        self.postings = defaultdict(list)
+        for cpro, cmun, name in municipalities[["cpro", "cmun", "municipio"]].itertuples(index=False):
+            for variant in name_variants(name):
+                key = name_key(variant)
+                self.exact.setdefault((cpro, key), cmun)
+                self.nationwide.setdefault(key, cmun)
+                self.keys[(cmun, key)] = trigrams(key)
+                for gram in self.keys[(cmun, key)]:
+                    self.postings[(cpro, gram)].append((cmun, key))
+
+    def fuzzy(self, cpro, key):
+        """Best trigram match within the province as (cmun, Dice score), or (None, 0)."""
+        grams = trigrams(key)
+        shared = Counter(entry for gram in grams for entry in self.postings.get((cpro, gram), ()))
+        best, score = None, 0.0
+        for (cmun, candidate), count in shared.items():
+            dice = 2 * count / (len(grams) + len(self.keys[(cmun, candidate)]))
+            if dice > score:
+                best, score = cmun, dice
+        return (best, score) if score >= MIN_SIMILARITY else (None, score)
+
+    def resolve(self, localidad):
+        """Resolve a "Province, Place (Hint)" string to (cpro, cmun, municipio, method, score)."""
+        province, _, place = localidad.partition(",")
+        if not place:
+            province, place = "", province
+        cpro = PROVINCE_CODES.get(name_key(province))
+        main, _, hint = place.partition("(")
+        keys = [name_key(variant) for variant in name_variants(main)]
+        # The text in brackets is either a province again or the municipality a hamlet belongs to
+        keys += [key for key in map(name_key, name_variants(hint.strip(" )."))) if key not in PROVINCE_CODES]
+        keys = [key for key in keys if key]
+
+        for key in keys:
+            cmun = self.exact.get((cpro, key)) if cpro else self.nationwide.get(key)
+            if cmun:
+                return cpro or cmun[:2], cmun, self.names[cmun], "exact", 1.0
+        if cpro and keys:
+            best, score = None, 0.0
+            for key in keys:
+                cmun, similarity = self.fuzzy(cpro, key)
+                if cmun and similarity > score:
+                    best, score = cmun, similarity
+            if best:
+                return cpro, best, self.names[best], "fuzzy", score
+        return cpro, None, None, "province" if cpro else "unresolved", 0.0
+
+
+RESOLUTION_COLUMNS = ["localidad", "cpro", "cmun", "municipio", "metodo", "similitud"]
+
+def load_index(paths=None):
+    paths = paths or get_paths()
+    return MunicipalityIndex(read_municipalities(paths.raw_file(MUNICIPALITY_LIST)))
+
+def resolve_localidades(localidades, paths=None, index=None):
+    """Resolution of every distinct localidad, as a DataFrame indexed by localidad.
+
+    Results are cached per version of the municipality list (and MIN_SIMILARITY); only names not
+    seen before are resolved.
+    """
+    paths = paths or get_paths()
+    path = cache_path("municipios", [paths.raw_file(MUNICIPALITY_LIST)], salt=str(MIN_SIMILARITY), paths=paths)
+    cached = pd.read_parquet(path) if os.path.exists(path) else pd.DataFrame(columns=RESOLUTION_COLUMNS)
+
+    wanted = pd.Series(pd.unique(pd.Series(localidades).dropna().astype(str)))
+    missing = wanted[~wanted.isin(cached["localidad"])]
+    if len(missing):
+        index = index or load_index(paths)
+        resolved = pd.DataFrame([(name, *index.resolve(name)) for name in missing],
+                                columns=RESOLUTION_COLUMNS)
+        cached = pd.concat([cached, resolved], ignore_index=True) if len(cached) else resolved
+        # The table grows as new names come in, so it is rewritten rather than built once
+        with atomic_path(path) as tmp:
+            cached.to_parquet(tmp, index=False)
+        print(f"[municipios] resolved {len(missing)} new localidades")
+
+    return cached.set_index("localidad")
+
+def resolve_races(races, paths=None):
+    """`races` with the INE province (cpro), municipality (cmun, municipio) and how it was matched."""
+    table = resolve_localidades(races["localidad"], paths)
+    columns = ["cpro", "cmun", "municipio", "metodo"]
+    resolved = table.reindex(races["localidad"].astype(str))[columns].set_axis(races.index)
+    return pd.concat([races, resolved], axis=1)
+
+def combine_municipalities():
+    """Race counts per year, province and municipality, for density analysis."""
+    paths = get_paths()
+    if not os.path.exists(paths.raw_file(MUNICIPALITY_LIST)):
+        raise FileNotFoundError(f"No {MUNICIPALITY_LIST} in {paths.raw}: download the INE municipality list to resolve race locations")
+    races = pd.read_csv(paths.processed_file("races_dataset.csv"), usecols=["año", "localidad"])
+    races = resolve_races(races, paths)
+    share = races["metodo"].value_counts(normalize=True)
+    print("[municipios] " + ", ".join(f"{method} {value:.1%}" for method, value in share.items()))
+
+    counts = races.groupby(["año", "cpro", "cmun", "municipio"], dropna=False).size().rename("num_carreras").reset_index()
+    counts.insert(2, "provincia", counts["cpro"].map(PROVINCES))
+    record(rows_in=len(races), rows_out=len(counts))
+    output_path = paths.processed_file("races_by_municipality.csv")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    counts.to_csv(output_path, index=False)
+    print(f"Races by municipality saved to: {output_path}")
+
+
+# === MAIN RUN ===
+if __name__ == "__main__":
+    combine_municipalities()
@@ -0,0 +1,173 @@
+# === PANEL REGRESSIONS ===
+# Two-way fixed-effects regressions on the CCAA x year panel of the combined dataset:
+#
+#   outcome[c, t] = regressors[c, t - lag] · beta + region[c] + year[t] + error[c, t]
+#
+# The region and year effects are absorbed by demeaning (alternating projections, which also
+# handles the unbalanced panel) instead of dummy columns, and standard errors are clustered by
+# region. Specifications that share a sample are demeaned together in one matrix, so sweeping
+# lags and indicator sets costs one demeaning per distinct sample plus a k x k solve per spec.
+
+import itertools
+import os
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.stats import t as student_t
+from config import get_paths
+from instrumentation import record
+
+ENTITY = "CCAA"
+TIME = "Año"
+OUTCOMES = ["num_carreras", "busquedas_running"]
+REGRESSORS = ["Renta neta media por persona", "Total_paro", "PIB_capita"]
+
+
+@dataclass(frozen=True)
+class Spec:
+    outcome: str
+    regressors: tuple
+    lag: int = 0   # years between the regressors and the outcome
+
+    @property
+    def columns(self):
+        return (self.outcome,) + tuple(lagged_name(col, self.lag) for col in self.regressors)
+
+
+def lagged_name(column, lag):
+    return column if lag == 0 else f"{column}_lag{lag}"
+
+
+def load_panel(df=None):
+    """The combined dataset as a panel sorted by region and year."""
+    if df is None:
+        df = pd.read_csv(get_paths().processed_file("powerbi_combined_dataset.csv"))
+    df = df.drop_duplicates(subset=[TIME, ENTITY])
+    return df.sort_values([ENTITY, TIME], ignore_index=True)
+
+
+def add_lags(panel, columns, lags):
+    """Add `column_lagN` columns holding each region's value N years earlier (missing if that year is absent)."""
+    panel = panel.copy()
+    shifted = panel[[ENTITY, TIME] + list(columns)]
+    for lag in lags:
+        if lag == 0:
+            continue
+        previous = shifted.assign(**{TIME: shifted[TIME] + lag})
+        previous = previous.rename(columns={col: lagged_name(col, lag) for col in columns})
+        panel = panel.merge(previous, on=[ENTITY, TIME], how="left")
+    return panel
+
+
+def group_matrix(codes):
+    """Sparse one-hot matrix (rows x groups) and the size of each group."""
+    n = len(codes)
+    groups = codes.max() + 1
+    onehot = sparse.csr_matrix((np.ones(n), (np.arange(n), codes)), shape=(n, groups))
+    return onehot, np.asarray(onehot.sum(axis=0)).ravel()
+
+
+def demean(values, entity, time, tol=1e-10, max_iter=1000):
+    """Remove region and year means from every column of `values` (n x p) at once.
+
+    Alternates between sweeping out the two sets of means until the largest change falls below
+    `tol`; on a balanced panel this converges after one round.
+    """
+    projections = [group_matrix(entity), group_matrix(time)]
+    result = values - values.mean(axis=0)
+    for _ in range(max_iter):
+        change = 0.0
+        for onehot, sizes in projections:
+            means = (onehot.T @ result) / sizes[:, None]
+            result = result - onehot @ means
+            change = max(change, np.abs(means).max(initial=0.0))
+        if change < tol:
+            break
+    return result
+
+
+def fit(y, x, clusters, absorbed=0):
+    """OLS on demeaned data with standard errors clustered on `clusters` (integer codes).
+
+    `absorbed` is the number of fixed effects removed by the demeaning that are not nested in
+    the clusters; they count towards the residual degrees of freedom.
+    """
+    n, k = x.shape
+    xtx_inv = np.linalg.inv(x.T @ x)
+    beta = xtx_inv @ (x.T @ y)
+    resid = y - x @ beta
+    onehot, _ = group_matrix(clusters)
+    scores = onehot.T @ (x * resid[:, None])            # one score vector per cluster
+    g = scores.shape[0]
+    # Stata's (reghdfe) small-sample factor; the region effects are nested in the region clusters
+    # and do not count, the year effects do
+    correction = g / (g - 1) * (n - 1) / (n - k - absorbed)
+    cov = correction * xtx_inv @ (scores.T @ scores) @ xtx_inv
+    se = np.sqrt(np.diag(cov))
+    tstat = beta / se
+    pvalue = 2 * student_t.sf(np.abs(tstat), df=g - 1)
+    r2_within = 1 - (resid @ resid) / (y @ y)
+    return beta, se, tstat, pvalue, r2_within, g
+
+
+def fit_specs(panel, specs):
+    """Fit every spec; specs with the same complete-case sample share one demeaning pass.
+
+    Returns one row per (spec, regressor) with the coefficient, clustered SE, t, p, the sample
+    size, the number of clusters and the within R².
+    """
+    samples = {}
+    for spec in specs:
+        mask = panel[list(spec.columns)].notna().all(axis=1).to_numpy()
+        samples.setdefault(mask.tobytes(), (mask, []))[1].append(spec)
+
+    rows = []
+    for mask, group in samples.values():
+        sample = panel[mask]
+        if len(sample) == 0:
+            continue
+        columns = list(dict.fromkeys(col for spec in group for col in spec.columns))
+        entity = pd.factorize(sample[ENTITY])[0]
+        time = pd.factorize(sample[TIME])[0]
+        within = pd.DataFrame(demean(sample[columns].to_numpy(dtype=float), entity, time), columns=columns)
+        for spec in group:
+            regressors = list(spec.columns[1:])
+            if len(sample) <= len(regressors) + time.max() + 1 or entity.max() < 1:
+                continue
+            try:
+                # One year effect is collinear with the region effects, so time.max() of them are absorbed
+                beta, se, tstat, pvalue, r2, clusters = fit(
+                    within[spec.outcome].to_numpy(), within[regressors].to_numpy(), entity, absorbed=time.max())
+            except np.linalg.LinAlgError:
+                print(f"Skipping {spec}: regressors are collinear once the fixed effects are removed")
+                continue
+            for i, name in enumerate(spec.regressors):
+                rows.append({
+                    "outcome": spec.outcome, "regressors": " + ".join(spec.regressors), "lag": spec.lag,
+                    "term": name, "coef": beta[i], "se": se[i], "t": tstat[i], "p_value": pvalue[i],
+                    "n": len(sample), "clusters": clusters, "r2_within": r2,
+                })
+    return pd.DataFrame(rows)
+
+
+def sweep(outcomes=OUTCOMES, regressors=REGRESSORS, lags=(0, 1, 2), panel=None):
+    """Every outcome against every non-empty subset of `regressors` at every lag."""
+    panel = load_panel() if panel is None else panel
+    panel = add_lags(panel, regressors, lags)
+    sets = [combo for size in range(1, len(regressors) + 1) for combo in itertools.combinations(regressors, size)]
+    specs = [Spec(outcome, combo, lag) for outcome in outcomes for combo in sets for lag in lags]
+    results = fit_specs(panel, specs)
+    record(rows_in=len(panel), rows_out=len(results))
+    return results
+
+
+# === MAIN RUN ===
+if __name__ == "__main__":
+    results = sweep()
+    output_path = get_paths().processed_file("panel_regressions.csv")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    results.to_csv(output_path, index=False)
+    print(f"{results[['outcome', 'regressors', 'lag']].drop_duplicates().shape[0]} specifications saved to: {output_path}")
+    full = results[results["regressors"] == " + ".join(REGRESSORS)]
+    print(full[["outcome", "lag", "term", "coef", "se", "p_value", "n"]].to_string(index=False))
@@ -0,0 +1,324 @@
+# === PIPELINE ===
+# Runs the project as a DAG of stages. Each stage is fingerprinted from the content of its code,
+# its input files and the fingerprints of the stages it depends on; a stage whose fingerprint is
+# unchanged and whose outputs still exist is skipped. Independent stages run concurrently.
+#
+#   python src/pipeline.py                  # run everything that is out of date
+#   python src/pipeline.py combine_races    # run one stage (and whatever it depends on)
+#   python src/pipeline.py --force          # ignore the fingerprints
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from cache import write_json
+from config import get_paths
+from instrumentation import Run
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@dataclass
+class Stage:
+    name: str
+    func: callable
+    deps: list = field(default_factory=list)
+    inputs: callable = lambda paths: []     # files or folders read by the stage
+    outputs: callable = lambda paths: []    # files or folders written by the stage
+    code: list = field(default_factory=list)  # modules in src/ whose source defines the stage
+    volatile: callable = None               # extra key for stages that depend on the outside world
+    requires: callable = lambda paths: []   # downloaded inputs no stage writes; skipped until they exist
+
+
+class FileHasher:
+    """Content hashes of files, memoised by (size, mtime) so unchanged inputs are not re-read."""
+
+    def __init__(self, known=None):
+        self.known = dict(known or {})
+        self.lock = threading.Lock()
+
+    def file(self, path):
+        stat = os.stat(path)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        with self.lock:
+            cached = self.known.get(path)
+        if cached and cached[:2] == stamp:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        with self.lock:
+            self.known[path] = stamp + [digest.hexdigest()]
+        return digest.hexdigest()
+
+    def path(self, path):
+        if not os.path.exists(path):
+            return "missing"
+        if os.path.isfile(path):
+            return self.file(path)
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith((".tmp", ".partial")):
+                    continue
+                full = os.path.join(root, name)
+                digest.update(os.path.relpath(full, path).encode("utf-8"))
+                digest.update(self.file(full).encode("ascii"))
+        return digest.hexdigest()
+
+
+class Pipeline:
+    def __init__(self, stages, state_path=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.paths = get_paths()
+        self.state_path = state_path or self.paths.cache_file("pipeline", "state.json")
+        self.state = self.load_state()
+        self.hasher = FileHasher(self.state.get("files"))
+
+    def load_state(self):
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"stages": {}, "files": {}}
+
+    def save_state(self):
+        self.state["files"] = self.hasher.known
+        write_json(self.state_path, self.state, indent=2, sort_keys=True)
+
+    def select(self, names=None):
+        """The requested stages plus everything upstream of them, in dependency order."""
+        order, seen = [], set()
+
+        def visit(name, trail=()):
+            if name in trail:
+                raise ValueError(f"Dependency cycle: {' -> '.join(trail + (name,))}")
+            if name in seen:
+                return
+            if name not in self.stages:
+                raise KeyError(f"Unknown stage: {name}")
+            for dep in self.stages[name].deps:
+                visit(dep, trail + (name,))
+            seen.add(name)
+            order.append(name)
+
+        for name in names or self.stages:
+            visit(name)
+        return order
+
+    def fingerprint(self, stage, fingerprints):
+        digest = hashlib.sha256(stage.name.encode("utf-8"))
+        for module in stage.code:
+            digest.update(self.hasher.file(os.path.join(SRC_DIR, module)).encode("ascii"))
+        for path in stage.inputs(self.paths):
+            digest.update(self.hasher.path(path).encode("ascii"))
+        for dep in stage.deps:
+            digest.update(fingerprints[dep].encode("ascii"))
+        if stage.volatile is not None:
+            digest.update(str(stage.volatile()).encode("utf-8"))
+        return digest.hexdigest()
+
+    def is_current(self, stage, fingerprint):
+        previous = self.state["stages"].get(stage.name, {})
+        return (previous.get("fingerprint") == fingerprint
+                and all(os.path.exists(path) for path in stage.outputs(self.paths)))
+
+    def run(self, names=None, force=False, workers=4, profile=False, trace_memory=False):
+        """Run the selected stages, skipping the ones that are up to date.
+
+        A stage starts as soon as all of its dependencies have finished. If a stage fails, the
+        stages downstream of it are not run. Each stage that runs is measured (see
+        instrumentation.py); `profile` also saves a cProfile dump per stage. Returns a dict of
+        stage name -> status.
+        """
+        self.metrics = Run("pipeline", profile=profile, trace_memory=trace_memory)
+        order = self.select(names)
+        status = {}
+        fingerprints = {}
+        pending = list(order)
+        running = {}
+
+        def start(pool, name):
+            stage = self.stages[name]
+            missing = [path for path in stage.requires(self.paths) if not os.path.exists(path)]
+            if missing:
+                # Not recorded in the state, so the stage runs as soon as the files are there
+                status[name] = "skipped"
+                print(f"[pipeline] {name}: skipped, missing {', '.join(missing)}")
+                return
+            # Inputs written by upstream stages exist now, so the fingerprint sees their content
+            fingerprints[name] = self.fingerprint(stage, fingerprints)
+            if not force and self.is_current(stage, fingerprints[name]):
+                status[name] = "cached"
+                print(f"[pipeline] {name}: up to date")
+                return
+            print(f"[pipeline] {name}: running")
+            running[pool.submit(self.run_stage, stage)] = name
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pending or running:
+                for name in list(pending):
+                    deps = self.stages[name].deps
+                    if any(status.get(dep) in ("failed", "skipped") for dep in deps):
+                        status[name] = "skipped"
+                        pending.remove(name)
+                        print(f"[pipeline] {name}: skipped, an upstream stage did not run")
+                    elif all(dep in status for dep in deps):
+                        pending.remove(name)
+                        start(pool, name)
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        status[name] = "failed"
+                        print(f"[pipeline] {name}: failed: {error!r}")
+                        continue
+                    status[name] = "done"
+                    # Re-hash after the run so the recorded fingerprint matches what is on disk now
+                    fingerprints[name] = self.fingerprint(self.stages[name], fingerprints)
+                    self.state["stages"][name] = {
+                        "fingerprint": fingerprints[name],
+                        "finished_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                        "seconds": round(future.result(), 2),
+                    }
+                    self.save_state()
+        self.save_state()
+        if self.metrics.stages:
+            print(self.metrics.summary())
+            print(f"[pipeline] metrics saved to: {self.metrics.save()}")
+        return status
+
+    def run_stage(self, stage):
+        with self.metrics.stage(stage.name) as metrics:
+            stage.func()
+        return metrics["wall_s"]
+
+
+# === STAGES ===
+# Imports happen inside the stage functions so `python src/pipeline.py` stays cheap to start
+
+def scrape_races():
+    from extraction import run_race_scraping
+    run_race_scraping()
+
+def scrape_gdp():
+    from extraction import scrape_gdp_data
+    scrape_gdp_data()
+
+def combine_races():
+    from transformation import combine_runedia_races
+    combine_runedia_races()
+
+def combine_socio():
+    from transformation import combine_socioeconomic_data, combine_trends
+    combine_socioeconomic_data()
+    combine_trends()
+
+def build_powerbi():
+    from transformation import create_combined_powerbi_dataset
+    create_combined_powerbi_dataset()
+
+def build_cube():
+    from transformation import build_race_cube
+    build_race_cube()
+
+def map_municipalities():
+    from municipalities import combine_municipalities
+    combine_municipalities()
+
+def link_series():
+    from series import combine_series
+    combine_series()
+
+def test_hypotheses():
+    import runpy
+    runpy.run_path(os.path.join(SRC_DIR, "stats.py"), run_name="__main__")
+
+def fit_panels():
+    import runpy
+    runpy.run_path(os.path.join(SRC_DIR, "panel.py"), run_name="__main__")
+
+def render_charts():
+    from visualization import render_charts, report_hypotheses
+    report_hypotheses()
+    render_charts()
+
+def today():
+    # Scraped sources change on the remote side; re-check them at most once a day
+    return datetime.date.today().isoformat()
+
+STAGES = [
+    Stage("scrape_races", scrape_races,
+          outputs=lambda p: [p.raw_file("runedia", "manifest.json")],
+          code=["extraction.py", "http_cache.py", "storage.py", "cache.py"], volatile=today),
+    Stage("scrape_gdp", scrape_gdp,
+          outputs=lambda p: [p.processed_file("gdp_dataset.csv")],
+          code=["extraction.py", "http_cache.py", "transformation.py", "cache.py"], volatile=today),
+    Stage("combine_races", combine_races, deps=["scrape_races"],
+          inputs=lambda p: [p.raw_file("runedia")],
+          outputs=lambda p: [p.processed_file("races_dataset.csv")],
+          code=["transformation.py", "storage.py"]),
+    Stage("combine_socio", combine_socio, deps=["scrape_gdp"],
+          inputs=lambda p: [p.processed_file("gdp_dataset.csv"), p.raw_file("RentaESP-ccaa.csv"),
+                            p.raw_file("tasaparoESP-ccaa.csv"), p.raw_file("google-trends"),
+                            p.raw_file("google-trends-national.csv")],
+          outputs=lambda p: [p.processed_file("running_trends_cleaned_for_powerbi.csv"),
+                             p.processed_file("google_trends.csv")],
+          code=["transformation.py", "cache.py"]),
+    Stage("build_powerbi", build_powerbi, deps=["combine_races", "combine_socio"],
+          inputs=lambda p: [p.processed_file("races_dataset.csv"),
+                            p.processed_file("running_trends_cleaned_for_powerbi.csv"),
+                            p.raw_file("licencias-ESP.csv")],
+          outputs=lambda p: [p.processed_file("powerbi_combined_dataset.csv")],
+          code=["transformation.py", "cache.py"]),
+    Stage("build_cube", build_cube, deps=["combine_races", "combine_socio"],
+          inputs=lambda p: [p.processed_file("races_dataset.csv"),
+                            p.processed_file("running_trends_cleaned_for_powerbi.csv")],
+          outputs=lambda p: [p.processed_file("race_cube")],
+          code=["transformation.py"]),
+    Stage("map_municipalities", map_municipalities, deps=["combine_races"],
+          inputs=lambda p: [p.processed_file("races_dataset.csv"), p.raw_file("municipios-INE.csv")],
+          outputs=lambda p: [p.processed_file("races_by_municipality.csv")],
+          code=["municipalities.py", "cache.py"],
+          requires=lambda p: [p.raw_file("municipios-INE.csv")]),
+    Stage("link_series", link_series, deps=["combine_races"],
+          inputs=lambda p: [p.processed_file("races_dataset.csv")],
+          outputs=lambda p: [p.processed_file("race_series.csv"), p.processed_file("series_churn.csv")],
+          code=["series.py", "transformation.py"]),
+    Stage("test_hypotheses", test_hypotheses, deps=["build_powerbi"],
+          inputs=lambda p: [p.processed_file("powerbi_combined_dataset.csv")],
+          outputs=lambda p: [p.processed_file("hypothesis_tests.csv")],
+          code=["stats.py"]),
+    Stage("fit_panels", fit_panels, deps=["build_powerbi"],
+          inputs=lambda p: [p.processed_file("powerbi_combined_dataset.csv")],
+          outputs=lambda p: [p.processed_file("panel_regressions.csv")],
+          code=["panel.py"]),
+    Stage("render_charts", render_charts, deps=["combine_races", "build_powerbi"],
+          inputs=lambda p: [p.processed_file("races_dataset.csv"),
+                            p.processed_file("powerbi_combined_dataset.csv")],
+          outputs=lambda p: [p.images],
+          code=["visualization.py"]),
+]
+
+# === MAIN RUN ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the running-trends pipeline")
+    parser.add_argument("stages", nargs="*", help=f"stages to run (default: all of {', '.join(s.name for s in STAGES)})")
+    parser.add_argument("--force", action="store_true", help="run the stages even if they are up to date")
+    parser.add_argument("--workers", type=int, default=4, help="stages to run at the same time")
+    parser.add_argument("--profile", action="store_true", help="save a cProfile dump of every stage that runs (its own thread only)")
+    parser.add_argument("--trace-memory", action="store_true", help="also record tracemalloc peaks (slower)")
+    args = parser.parse_args()
+    result = Pipeline(STAGES).run(args.stages or None, force=args.force, workers=args.workers,
+                                  profile=args.profile, trace_memory=args.trace_memory)
+    sys.exit(1 if "failed" in result.values() else 0)
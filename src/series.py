@@ -0,0 +1,202 @@
+# === RACE SERIES ===
+# Links the editions of a race across years ("XV Media Maratón de Aranjuez", "Media maratón
+# Aranjuez 2019") into one series, so race counts can be split into new, recurring and
+# discontinued events.
+#
+# Each race becomes a set of shingles: character 4-grams of its title (lowercase, accents,
+# edition ordinals and years removed) plus 4-grams of its locality. MinHash signatures estimate the
+# Jaccard similarity of those sets, and locality-sensitive hashing puts races whose signatures
+# agree on a whole band into the same bucket. Only races that share a bucket (and a municipality)
+# are ever compared, so the cost grows with the number of races, not with the number of pairs. Linked
+# races form a series, most similar pairs first, as long as a series keeps one race a year; it is
+# identified by the race_id of its first edition so that ids do not change when newer years are added.
+# Years are the race's own (transformation.race_year), not the scrape partition it was found in.
+#
+#   python src/series.py      # writes data/processed/race_series.csv and series_churn.csv
+
+import os
+import re
+import zlib
+import numpy as np
+import pandas as pd
+from config import get_paths
+from instrumentation import record
+from transformation import race_year
+
+SHINGLE_SIZE = 4
+BANDS = 32
+ROWS_PER_BAND = 4
+# Smallest estimated Jaccard similarity for two races of a bucket to be linked
+SIMILARITY = 0.7
+PRIME = (1 << 31) - 1
+# Edition markers: roman numerals, ordinals ("15ª", "3º", "1st"), years and "edición"; other numbers
+# ("10 km", "8km") tell races apart and are kept
+ROMAN = r"(?=[ivxlc])c{0,3}(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3})"
+EDITION = re.compile(rf"\b(?:{ROMAN}|\d+(?:a|o|st|nd|rd|th|ª|º)|(?:19|20)\d\d|edicion|ed)\b")
+
+
+def normalize(texts):
+    """Lowercase, accent-free titles without punctuation or edition markers."""
+    # Object dtype: the edition pattern needs a lookahead, which the pyarrow regex engine lacks
+    text = texts.fillna("").astype(object).str.lower().str.normalize("NFD")
+    text = text.str.replace(r"[\u0300-\u036f]", "", regex=True).str.replace(r"[^\w\s]", " ", regex=True)
+    text = text.str.replace(EDITION, " ", regex=True)
+    return text.str.split().str.join(" ")
+
+def shingles(text, prefix=""):
+    padded = f" {text} "
+    return {prefix + padded[i:i + SHINGLE_SIZE] for i in range(max(len(padded) - SHINGLE_SIZE + 1, 1))}
+
+
+def signatures(title, place, num_perm=BANDS * ROWS_PER_BAND, seed=0, chunk=100_000):
+    """MinHash signatures (races x num_perm, uint32) of the normalized title and place shingles."""
+    # Editions often normalize to the same text, so each distinct (title, place) is hashed once
+    document, distinct = pd.factorize(title + "|" + place)
+    sets = [list(shingles(t) | shingles(p, "@")) for t, p in (text.split("|") for text in distinct)]
+    sizes = np.fromiter((len(s) for s in sets), dtype=np.int64, count=len(sets))
+    codes, uniques = pd.factorize(pd.Series([item for s in sets for item in s], dtype=object))
+
+    # crc32 is stable across processes (unlike hash()), so signatures are reproducible
+    base = np.fromiter((zlib.crc32(s.encode("utf-8")) & PRIME for s in uniques), dtype=np.uint64, count=len(uniques))
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, PRIME, size=num_perm, dtype=np.uint64)
+    # One column per distinct shingle; reducing along the last axis keeps reduceat on contiguous memory
+    hashed = ((a[:, None] * base + b[:, None]) % PRIME).astype(np.uint32)
+
+    starts = np.concatenate([[0], np.cumsum(sizes)])
+    result = np.empty((num_perm, len(sets)), dtype=np.uint32)
+    first = 0
+    while first < len(sets):
+        # Whole documents per chunk, about `chunk` shingles each
+        last = max(int(np.searchsorted(starts, starts[first] + chunk, side="right")) - 1, first + 1)
+        block = hashed.take(codes[starts[first]:starts[last]], axis=1)
+        result[:, first:last] = np.minimum.reduceat(block, starts[first:last] - starts[first], axis=1)
+        first = last
+    return result.T[document]
+
+
+def candidate_pairs(signature, blocks):
+    """Pairs of rows that agree on at least one band and share a block (integer codes).
+
+    Each bucket contributes edges from its first member to every other member, which is enough
+    to connect it.
+    """
+    pairs = []
+    band_mix = np.arange(1, ROWS_PER_BAND + 1, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    for band in range(BANDS):
+        rows = signature[:, band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].astype(np.uint64)
+        with np.errstate(over="ignore"):
+            keys = (rows * band_mix).sum(axis=1) ^ (blocks.astype(np.uint64) * np.uint64(0xC2B2AE3D27D4EB4F))
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        leader = order[np.repeat(starts, np.diff(np.r_[starts, len(order)]))]
+        linked = leader != order
+        pairs.append(np.stack([leader[linked], order[linked]], axis=1))
+    n = np.int64(len(signature))
+    codes = np.unique(np.concatenate(pairs).astype(np.int64) @ np.array([n, 1]))
+    pairs = np.stack([codes // n, codes % n], axis=1)
+    # Different keys can collide in the 64-bit mix; the block must match exactly
+    return pairs[blocks[pairs[:, 0]] == blocks[pairs[:, 1]]]
+
+
+def one_race_a_year(n, pairs, score, year):
+    """Series label of each of `n` races, linking `pairs` from the highest `score` down.
+
+    Unlike connected components, a link is skipped when the two series already share a year, so
+    a chain of similar names ("8km de la Media Maratón de X" ~ "Media Maratón de X") cannot put
+    two races of the same year in one series.
+    """
+    parent = list(range(n))
+    years = [{y} for y in year.tolist()]
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in pairs[np.argsort(-score, kind="stable")].tolist():
+        a, b = find(a), find(b)
+        if a == b or not years[a].isdisjoint(years[b]):
+            continue
+        if len(years[a]) < len(years[b]):
+            a, b = b, a
+        parent[b] = a
+        years[a] |= years[b]
+    return np.array([find(i) for i in range(n)])
+
+
+def link_series(races):
+    """`races` (titulo, localidad, provincia, año, fecha, race_id) with a `series_id` column."""
+    races = races.reset_index(drop=True)
+    title = normalize(races["titulo"])
+    # The municipality part of "Province, Municipality"
+    place = normalize(races["localidad"].str.split(",", n=1).str[-1])
+    signature = signatures(title, place)
+    # Template names ("Carreira popular concello de ...") differ only by town, so races are only
+    # compared within their CCAA and municipality
+    blocks = pd.factorize(races["provincia"].astype(str) + "|" + place)[0]
+    pairs = candidate_pairs(signature, blocks)
+    similarity = (signature[pairs[:, 0]] == signature[pairs[:, 1]]).mean(axis=1)
+    # A series holds one edition a year: two races of the same year are different events
+    year = race_year(races).to_numpy()
+    keep = (similarity >= SIMILARITY) & (year[pairs[:, 0]] != year[pairs[:, 1]])
+
+    component = one_race_a_year(len(races), pairs[keep], similarity[keep], year)
+    # The first edition (earliest year, then lowest race_id) names the series
+    first = races.assign(component=component, year=year).sort_values(["year", "race_id"], kind="stable")
+    first = first.drop_duplicates("component").set_index("component")["race_id"]
+    return races.assign(series_id=pd.Series(component).map(first).astype(str).radd("s").to_numpy())
+
+
+def series_churn(linked):
+    """New, recurring and discontinued series per CCAA and year, with year-on-year retention.
+
+    A series is discontinued in the year of its last edition; the last year of the data is left
+    out of that count since its races may still come back.
+    """
+    linked = linked.assign(año=race_year(linked))
+    active = linked[["provincia", "series_id", "año"]].drop_duplicates()
+    span = active.groupby("series_id")["año"].agg(["min", "max"])
+    active = active.join(span, on="series_id")
+    final_year = active["año"].max()
+    active["nueva"] = active["año"] == active["min"]
+    active["discontinuada"] = (active["año"] == active["max"]) & (active["año"] < final_year)
+    previous = active[["series_id", "año"]].assign(año=active["año"] + 1, continua=True)
+    active = active.merge(previous, on=["series_id", "año"], how="left")
+    active["continua"] = active["continua"].notna()
+
+    churn = active.groupby(["provincia", "año"]).agg(
+        series=("series_id", "size"), nuevas=("nueva", "sum"),
+        recurrentes=("continua", "sum"), discontinuadas=("discontinuada", "sum"),
+    ).reset_index()
+    churn["carreras"] = linked.groupby(["provincia", "año"]).size().reindex(
+        pd.MultiIndex.from_frame(churn[["provincia", "año"]])).to_numpy()
+    # Share of last year's series that ran again this year
+    before = churn[["provincia", "año", "series"]].assign(año=churn["año"] + 1).rename(columns={"series": "previas"})
+    churn = churn.merge(before, on=["provincia", "año"], how="left")
+    churn["retencion"] = churn["recurrentes"] / churn["previas"]
+    return churn.drop(columns="previas")
+
+
+def combine_series():
+    paths = get_paths()
+    races = pd.read_csv(paths.processed_file("races_dataset.csv"),
+                        usecols=["race_id", "titulo", "localidad", "provincia", "año", "fecha"],
+                        parse_dates=["fecha"])
+    linked = link_series(races)
+    record(rows_in=len(races), rows_out=len(linked))
+    print(f"[series] {len(linked)} races in {linked['series_id'].nunique()} series")
+    output_path = paths.processed_file("race_series.csv")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    linked[["race_id", "series_id"]].to_csv(output_path, index=False)
+    churn_path = paths.processed_file("series_churn.csv")
+    series_churn(linked).to_csv(churn_path, index=False)
+    print(f"Race series saved to: {output_path} and {churn_path}")
+
+
+# === MAIN RUN ===
+if __name__ == "__main__":
+    combine_series()
@@ -0,0 +1,215 @@
+# === HYPOTHESIS TESTS ===
+# Pearson and Spearman correlations for every pair of indicators in the combined dataset, at three
+# aggregation levels, with permutation p-values and bootstrap confidence intervals.
+#
+# All pairs are computed together from matrix products: the permutation and bootstrap resamples
+# are stacked along a leading axis and processed in chunks. The only Python loop is over the
+# distinct sets of rows where pairs of indicators are both present (a handful, since indicators
+# only go missing for whole years), never over pairs.
+
+import os
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+from config import get_paths
+from instrumentation import record
+
+INDICATORS = [
+    "PIB_anual", "PIB_capita", "Renta neta media por persona", "Renta media por unidad de consumo",
+    "Total_paro", "busquedas_running", "num_carreras", "licencias_atletismo",
+]
+# Counts add up when regions or years are pooled; everything else is averaged
+SUM_COLUMNS = {"num_carreras"}
+
+LEVELS = {
+    "national": "Año",   # one row per year, regions pooled
+    "panel": None,       # one row per (Año, CCAA)
+    "ccaa": "CCAA",      # one row per region, years pooled
+}
+METHODS = ("pearson", "spearman")
+
+
+def aggregate(df, level, indicators=INDICATORS):
+    """Rows of `indicators` at an aggregation level from LEVELS."""
+    key = LEVELS[level]
+    columns = [col for col in indicators if col in df.columns]
+    if key is None:
+        return df[columns].astype(float)
+    grouped = df.groupby(key)
+    result = grouped[columns].mean()
+    for col in SUM_COLUMNS.intersection(columns):
+        # min_count keeps all-missing groups missing instead of summing them to 0
+        result[col] = grouped[col].sum(min_count=1)
+    return result.astype(float)
+
+
+def standardize(x):
+    """Centre and scale the columns of x (..., n, k) so that Z^T Z / n is the correlation matrix."""
+    x = x - x.mean(axis=-2, keepdims=True)
+    scale = np.sqrt((x * x).mean(axis=-2, keepdims=True))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return x / scale
+
+
+def correlations(x):
+    """Correlation matrices of x (..., n, k), one per leading index."""
+    z = standardize(x)
+    return np.matmul(np.swapaxes(z, -1, -2), z) / x.shape[-2]
+
+
+def to_ranks(x):
+    return rankdata(x, axis=-2)
+
+
+def permutation_pvalues(x, observed, n_resamples, rng, chunk):
+    """Two-sided p-values for every pair: how often shuffling one side matches |observed|.
+
+    Each resample permutes the rows of the whole matrix, and Z^T Z[perm] gives the correlation of
+    every column with every permuted column at once.
+    """
+    n = x.shape[0]
+    z = standardize(x)
+    exceed = np.zeros(observed.shape)
+    threshold = np.abs(observed) - 1e-12
+    for start in range(0, n_resamples, chunk):
+        size = min(chunk, n_resamples - start)
+        perms = rng.permuted(np.tile(np.arange(n), (size, 1)), axis=1)
+        shuffled = z[perms]
+        r = np.matmul(z.T, shuffled) / n
+        exceed += (np.abs(r) >= threshold).sum(axis=0)
+    return (exceed + 1) / (n_resamples + 1)
+
+
+def resample_counts(rng, size, n):
+    """How many times each row is drawn in `size` bootstrap resamples of n rows, as (size, n)."""
+    draws = rng.integers(0, n, size=(size, n)) + n * np.arange(size)[:, None]
+    return np.bincount(draws.ravel(), minlength=size * n).reshape(size, n).astype(float)
+
+
+def weighted_correlations(x, weights):
+    """Correlation matrices of x (n, k) or (b, n, k) with each row repeated weights[b, row] times."""
+    n = weights.shape[1]
+    if x.ndim == 2:
+        x = x[None]
+    mean = np.einsum("bn,bni->bi", weights, np.broadcast_to(x, weights.shape + x.shape[2:])) / n
+    centred = x - mean[:, None, :]
+    cov = np.matmul((centred * weights[:, :, None]).transpose(0, 2, 1), centred) / n
+    scale = np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return cov / scale[:, :, None] / scale[:, None, :]
+
+
+def resampled_ranks(x, weights):
+    """Average ranks each row of x (n, k) would get inside every weighted resample, as (b, n, k).
+
+    Ranks come from cumulative counts over the sorted distinct values of each column, so no
+    resample has to be sorted.
+    """
+    ranks = np.empty((weights.shape[0],) + x.shape)
+    for k in range(x.shape[1]):
+        _, code = np.unique(x[:, k], return_inverse=True)
+        per_value = weights @ np.eye(code.max() + 1)[code]
+        below = np.cumsum(per_value, axis=1) - per_value
+        ranks[:, :, k] = (below + (per_value + 1) / 2)[:, code]
+    return ranks
+
+
+def bootstrap_intervals(x, method, n_resamples, rng, chunk, confidence):
+    """Percentile bootstrap intervals for every pair, resampling rows with replacement.
+
+    A resample is represented by how often each row is drawn, so the correlations are weighted
+    sums over the original rows instead of over materialised copies.
+    """
+    n = x.shape[0]
+    samples = []
+    for start in range(0, n_resamples, chunk):
+        weights = resample_counts(rng, min(chunk, n_resamples - start), n)
+        values = resampled_ranks(x, weights) if method == "spearman" else x
+        samples.append(weighted_correlations(values, weights))
+    samples = np.concatenate(samples)
+    tail = (1 - confidence) / 2
+    low, high = np.nanquantile(samples, [tail, 1 - tail], axis=0)
+    return low, high
+
+
+def complete_row_sets(values):
+    """Group the pairs (i, j), i < j, by the exact set of rows where both are present.
+
+    Yields (rows mask, i indices, j indices) for each distinct set.
+    """
+    present = ~np.isnan(values)
+    left, right = np.triu_indices(values.shape[1], k=1)
+    masks = (present[:, left] & present[:, right]).T
+    distinct, group = np.unique(masks, axis=0, return_inverse=True)
+    for g, mask in enumerate(distinct):
+        members = np.flatnonzero(group.ravel() == g)
+        yield mask, left[members], right[members]
+
+
+def test_correlations(data, n_resamples=10_000, confidence=0.95, seed=0, chunk=500, min_rows=4):
+    """Pearson and Spearman tests for every pair of columns of `data` (a DataFrame of numbers).
+
+    Pairs use the rows where both columns are present. Returns one row per (x, y, method) with the
+    coefficient, the permutation p-value and the bootstrap interval.
+    """
+    rng = np.random.default_rng(seed)
+    values = data.to_numpy(dtype=float)
+    columns = np.array(data.columns, dtype=object)
+    frames = []
+    for mask, left, right in complete_row_sets(values):
+        n = int(mask.sum())
+        if n < min_rows:
+            continue
+        involved, index = np.unique(np.concatenate([left, right]), return_inverse=True)
+        a, b = index[:len(left)], index[len(left):]
+        subset = values[mask][:, involved]
+        for method in METHODS:
+            x = to_ranks(subset) if method == "spearman" else subset
+            observed = correlations(x)
+            pvalues = permutation_pvalues(x, observed, n_resamples, rng, chunk)
+            low, high = bootstrap_intervals(subset, method, n_resamples, rng, chunk, confidence)
+            frames.append(pd.DataFrame({
+                "x": columns[left], "y": columns[right], "method": method, "n": n,
+                "r": observed[a, b], "p_value": pvalues[a, b], "ci_low": low[a, b], "ci_high": high[a, b],
+            }))
+    if not frames:
+        return pd.DataFrame(columns=["x", "y", "method", "n", "r", "p_value", "ci_low", "ci_high"])
+    return pd.concat(frames, ignore_index=True).sort_values(["x", "y", "method"], kind="stable", ignore_index=True)
+
+
+def run_hypothesis_tests(df=None, levels=LEVELS, indicators=INDICATORS, **kwargs):
+    """Correlation tests for all indicator pairs at every aggregation level of the combined dataset."""
+    if df is None:
+        df = pd.read_csv(get_paths().processed_file("powerbi_combined_dataset.csv"))
+        df = df.drop_duplicates(subset=["Año", "CCAA"])
+    frames = []
+    for level in levels:
+        result = test_correlations(aggregate(df, level, indicators), **kwargs)
+        result.insert(0, "level", level)
+        frames.append(result)
+    results = pd.concat(frames, ignore_index=True)
+    record(rows_in=len(df), rows_out=len(results))
+    return results
+
+
+# === MAIN RUN ===
+if __name__ == "__main__":
+    import time
+    started = time.perf_counter()
+    results = run_hypothesis_tests()
+    output_path = get_paths().processed_file("hypothesis_tests.csv")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    results.to_csv(output_path, index=False)
+    print(f"{len(results)} tests in {time.perf_counter() - started:.1f}s, saved to: {output_path}")
+
+    # The three hypotheses from the report
+    hypotheses = [
+        ("H1", "national", "Renta neta media por persona", "busquedas_running"),
+        ("H2", "national", "Total_paro", "busquedas_running"),
+        ("H3", "ccaa", "PIB_anual", "num_carreras"),
+    ]
+    for name, level, x, y in hypotheses:
+        rows = results[(results["level"] == level) & (results["x"].isin([x, y])) & (results["y"].isin([x, y]))]
+        for row in rows.itertuples():
+            print(f"{name} {row.method:8s} {x} vs {y}: r={row.r:.2f} "
+                  f"[{row.ci_low:.2f}, {row.ci_high:.2f}] p={row.p_value:.4f} (n={row.n})")
@@ -0,0 +1,140 @@
+# === RACE STORAGE ===
+# Parquet dataset of raw races partitioned by provincia/año, shared by extraction and transformation.
+# pyarrow is only imported when the dataset is actually used.
+
+import csv
+import os
+import re
+import pandas as pd
+from cache import atomic_path
+
+RACE_COLUMNS = ['dia', 'mes', 'titulo', 'enlace', 'localidad', 'tipo', 'distancia', 'provincia', 'año']
+DATA_COLUMNS = RACE_COLUMNS[:7]
+CSV_NAME = re.compile(r"^carreras_(?P<province>.+)_(?P<year>\d{4})\.csv$")
+
+# A few early files were saved with English headers
+HEADER_ALIASES = dict(zip(['day', 'month', 'title', 'link', 'location', 'type', 'distance', 'province', 'year'], RACE_COLUMNS))
+
+PROVINCES = [
+    "andalucia", "navarra", "asturias", "aragon", "canarias", "cantabria",
+    "castilla-la-mancha", "castilla-y-leon", "catalunya", "ceuta", "euskadi",
+    "extremadura", "galicia", "illes-balears", "la-rioja", "madrid", "melilla",
+    "murcia", "valencia"
+]
+MONTHS = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio",
+          "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
+
+RACE_DTYPES = {
+    "dia": "string[pyarrow]",
+    "mes": pd.CategoricalDtype(MONTHS),
+    "titulo": "string[pyarrow]",
+    "enlace": "string[pyarrow]",
+    "localidad": "string[pyarrow]",
+    "tipo": "category",
+    "distancia": "string[pyarrow]",
+    "provincia": pd.CategoricalDtype(sorted(PROVINCES)),
+    "año": "int16",
+}
+
+def read_header(path):
+    """Return the delimiter and column names of a CSV, sniffed from its first line."""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        header = f.readline()
+    try:
+        delimiter = csv.Sniffer().sniff(header, delimiters=",;").delimiter
+    except csv.Error:
+        delimiter = ","
+    return delimiter, next(csv.reader([header], delimiter=delimiter), [])
+
+def read_race_file(path):
+    """Read one raw race CSV and validate it against RACE_DTYPES and the known province slugs.
+
+    Returns `(df, None)` on success or `(None, reason)` when the file is rejected.
+    """
+    try:
+        delimiter, header = read_header(path)
+        columns = [HEADER_ALIASES.get(col, col) for col in header]
+        if columns[:9] != RACE_COLUMNS:
+            return None, f"unexpected header: {columns[:9]}"
+        df = pd.read_csv(path, sep=delimiter, header=0, names=columns, usecols=RACE_COLUMNS,
+                         dtype={**RACE_DTYPES, "provincia": str, "año": str}, encoding="utf-8-sig")
+    except Exception as e:
+        return None, f"unreadable: {e}"
+    if df.empty:
+        return None, "empty"
+    # The categorical cast would turn an unknown slug into NaN, and those rows are dropped downstream
+    unknown = ~df["provincia"].isin(PROVINCES)
+    if unknown.any():
+        return None, f"unknown provincia: {sorted(df.loc[unknown, 'provincia'].fillna('<missing>').unique())}"
+    df["provincia"] = df["provincia"].astype(RACE_DTYPES["provincia"])
+    year = pd.to_numeric(df["año"], errors="coerce")
+    if year.isna().any():
+        return None, "non-integer año"
+    return df[RACE_COLUMNS].assign(año=year.astype("int16")), None
+
+def race_schema():
+    import pyarrow as pa
+    dictionary = pa.dictionary(pa.int8(), pa.string())
+    return pa.schema([
+        ("dia", pa.string()),
+        ("mes", dictionary),
+        ("titulo", pa.string()),
+        ("enlace", pa.string()),
+        ("localidad", pa.string()),
+        ("tipo", dictionary),
+        ("distancia", pa.string()),
+    ])
+
+def partition_schema():
+    import pyarrow as pa
+    return pa.schema([("provincia", pa.string()), ("año", pa.int16())])
+
+def partition_path(root, province, year):
+    return os.path.join(root, f"provincia={province}", f"año={year}", "part-0.parquet")
+
+def write_race_partition(df, root, province, year):
+    """Write one (province, year) partition, replacing any previous version atomically."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    path = partition_path(root, province, year)
+    data = df.reindex(columns=DATA_COLUMNS)
+    table = pa.Table.from_pandas(data, schema=race_schema(), preserve_index=False)
+    with atomic_path(path) as tmp:
+        pq.write_table(table, tmp, compression="zstd")
+    return path
+
+def read_races(root, columns=None, provinces=None, years=None):
+    """Read the race dataset, pruning partitions by province/year and projecting `columns`."""
+    import pyarrow.dataset as ds
+    dataset = ds.dataset(root, format="parquet", partitioning=ds.partitioning(partition_schema(), flavor="hive"))
+    condition = None
+    if provinces is not None:
+        condition = ds.field("provincia").isin(list(provinces))
+    if years is not None:
+        by_year = ds.field("año").isin([int(y) for y in years])
+        condition = by_year if condition is None else condition & by_year
+    table = dataset.to_table(columns=columns, filter=condition)
+    df = table.to_pandas()
+    for col in ("provincia", "mes", "tipo"):
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+def migrate_csv_tree(csv_folder, root):
+    """One-time conversion of carreras_{province}_{year}.csv files into the partitioned dataset.
+
+    Partition keys come from the file name. Returns the names of files that could not be converted.
+    """
+    skipped = []
+    for file in sorted(os.listdir(csv_folder)):
+        match = CSV_NAME.match(file)
+        if not match:
+            continue
+        df, reason = read_race_file(os.path.join(csv_folder, file))
+        if df is None:
+            print(f"Skipping {file}: {reason}")
+            skipped.append(file)
+            continue
+        write_race_partition(df, root, match["province"], int(match["year"]))
+    print(f"Migrated CSV tree {csv_folder} to {root} ({len(skipped)} files skipped)")
+    return skipped
@@ -1,67 +1,752 @@
 
+import csv
 import os
+import sys
+import threading
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from pandas.api.types import union_categoricals
+from cache import atomic_path, cached_parquet, write_json
+from config import get_paths
+from instrumentation import record
+from storage import MONTHS, RACE_COLUMNS, migrate_csv_tree, read_race_file, read_races
+
+# === Partitioned Parquet dataset of raw races ===
+def load_race_dataset(columns=None, provinces=None, years=None):
+    dataset_path = get_paths().raw_file("runedia_dataset")
+    return read_races(dataset_path, columns, provinces, years)
+
+def migrate_runedia_to_parquet():
+    folder_path = get_paths().raw_file("runedia")
+    dataset_path = get_paths().raw_file("runedia_dataset")
+    return migrate_csv_tree(folder_path, dataset_path)
+
+
+# === Load every raw race CSV in parallel, validated against the race schema ===
+def load_race_files(folder_path, workers=None):
+    """Read all race CSVs in `folder_path` on a process pool.
+
+    Returns the concatenated, typed frame and a report with one row per rejected file.
+    """
+    files = sorted(file for file in os.listdir(folder_path) if file.endswith(".csv"))
+    paths = [os.path.join(folder_path, file) for file in files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(read_race_file, paths, chunksize=8))
+
+    frames = [df for df, _ in results if df is not None]
+    report = pd.DataFrame(
+        [{"file": file, "reason": reason} for file, (df, reason) in zip(files, results) if df is None],
+        columns=["file", "reason"],
+    )
+    if not frames:
+        return pd.DataFrame(columns=RACE_COLUMNS), report
+
+    # Each file has its own race types; give them all the same categories so concat keeps the dtype
+    tipo = pd.CategoricalDtype(union_categoricals([df["tipo"] for df in frames]).categories)
+    combined = pd.concat([df.astype({"tipo": tipo}) for df in frames], ignore_index=True)
+    return combined, report
+
+
+# === Deduplicate races by their Runedia race ID ===
+def add_race_id(df):
+    # Every race link ends in its numeric ID, e.g. .../media-maraton-de-aranjuez-2015/201511152/
+    ids = df["enlace"].astype("string").str.extract(r"/(\d+)/?$", expand=False)
+    return df.assign(race_id=pd.to_numeric(ids, errors="coerce").astype("Int64"))
+
+def dedupe_races(df):
+    """Keep one row per race_id; rows without an ID are dropped.
+
+    When copies of a race disagree, the row with the fewest missing fields wins, then the one
+    from the most recent `año` partition, then the one loaded last.
+    """
+    df = df[df["race_id"].notna()]
+    missing = df.isna().sum(axis=1).to_numpy()
+    order = np.lexsort((-np.arange(len(df)), -df["año"].to_numpy(), missing, df["race_id"].to_numpy()))
+    ranked = df.iloc[order]
+    deduped = ranked[~ranked["race_id"].duplicated()]
+    # Copies that differ only in the año partition they were listed under are not conflicts
+    distinct = ranked.drop_duplicates(subset=[col for col in RACE_COLUMNS if col != "año"])
+    conflicts = distinct.loc[distinct["race_id"].duplicated(), "race_id"].nunique()
+    print(f"Dropped {len(df) - len(deduped)} duplicate races ({conflicts} IDs with conflicting copies)")
+    return deduped.sort_index()
+
+class RaceIdIndex:
+    """Sorted array of every race_id already in races_dataset.csv, persisted as .npy between runs."""
+
+    def __init__(self, path):
+        self.path = path
+        self.ids = np.load(path) if os.path.exists(path) else np.empty(0, dtype=np.int64)
+
+    def contains(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.ids, ids), max(len(self.ids) - 1, 0))
+        return (self.ids[pos] == ids) if len(self.ids) else np.zeros(len(ids), dtype=bool)
+
+    def add(self, ids):
+        self.ids = np.union1d(self.ids, np.asarray(ids, dtype=np.int64))
+
+    def save(self):
+        with atomic_path(self.path) as tmp:
+            with open(tmp, "wb") as f:
+                np.save(f, self.ids)
+
+# Scrape workers append from several threads
+APPEND_LOCK = threading.Lock()
+
+def append_race_partition(df):
+    """Append one scraped partition to races_dataset.csv without rescanning the history.
+
+    The rows are deduplicated and normalized exactly as in combine_runedia_races. Races whose ID
+    is already in the persisted index are skipped, so in this mode the first-seen copy of a race
+    is the one that is kept; a full combine_runedia_races() run applies the usual policy again.
+    """
+    output_path = get_paths().processed_file("races_dataset.csv")
+    races = normalize_races(dedupe_races(add_race_id(df)).dropna())
+    with APPEND_LOCK:
+        index = RaceIdIndex(get_paths().processed_file("race_ids.npy"))
+        exists = os.path.exists(output_path)
+        if exists and not len(index.ids):
+            # A dataset built before the index existed is scanned once to seed it
+            index.add(pd.read_csv(output_path, usecols=["race_id"])["race_id"].to_numpy())
+        new_races = races[~index.contains(races["race_id"].to_numpy())]
+        if exists:
+            new_races = new_races.reindex(columns=pd.read_csv(output_path, nrows=0).columns)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        new_races.to_csv(output_path, mode="a", header=not exists, index=False)
+        index.add(new_races["race_id"].to_numpy())
+        index.save()
+    print(f"Appended {len(new_races)} new races to: {output_path}")
+    return len(new_races)
+
+
+# === Normalize raw race fields into typed columns ===
+DISTANCE_BINS = [0, 7_500, 15_000, 30_000, 43_000, float("inf")]
+DISTANCE_LABELS = ["5k", "10k", "half", "marathon", "ultra"]
+
+# "Ruta" is Runedia's label for road races up to 2014, when "Asfalto" took over
+SURFACES = {
+    "asfalto": "asfalto", "ruta": "asfalto", "bici carretera": "asfalto", "pista": "pista",
+    "montaña": "montaña", "esquí montaña": "montaña", "raid": "montaña", "orientación": "montaña",
+    "tierra": "tierra", "cross": "tierra", "btt": "tierra", "btt descenso": "tierra", "canicross": "tierra",
+    "travesía": "agua", "natación": "agua",
+    "triatlón": "mixta", "duatlón": "mixta", "acuatlón": "mixta", "obstáculos": "mixta",
+}
+SURFACE_LABELS = ["asfalto", "pista", "montaña", "tierra", "agua", "mixta", "otros"]
+
+def map_categories(values, func, dtype=None):
+    """Apply a Series -> Series `func` to the distinct values only and broadcast the result back."""
+    codes = values.astype("category")
+    mapped = func(pd.Series(codes.cat.categories))
+    result = pd.Series(mapped.to_numpy(), dtype=dtype).take(codes.cat.codes.clip(lower=0)).to_numpy()
+    return pd.Series(result, index=values.index, dtype=dtype).where(codes.cat.codes >= 0)
+
+def normalize_races(df):
+    """Add typed columns derived from the raw race strings, without any row-wise apply.
+
+    fecha: race date built from `dia` ("D-15"), the Spanish month name in `mes` and the race's
+    own year from its link slug (".../media-maraton-de-aranjuez-2015/201511152/").
+    distancia_m: distance in metres; 0 and placeholder values of 1000 km or more become NA.
+    distancia_cat: 5k / 10k / half / marathon / ultra bucket.
+    tipo: lower-cased discipline; superficie: the surface it is run on.
+    """
+    day = map_categories(df["dia"], lambda s: s.str.extract(r"(\d{1,2})$", expand=False).astype(float))
+    month = pd.Series(pd.Categorical(df["mes"], categories=MONTHS).codes + 1, index=df.index).where(df["mes"].notna())
+    slug_year = map_categories(df["enlace"], lambda s: s.str.extract(r"-(\d{4})/\d+/?$", expand=False).astype(float))
+    year = slug_year.fillna(df["año"].astype(float))
+    fecha = pd.to_datetime(pd.DataFrame({"year": year, "month": month, "day": day}), errors="coerce")
+
+    metres = map_categories(df["distancia"], lambda s: s.str.extract(r"(\d+)", expand=False).astype(float))
+    metres = metres.where((metres > 0) & (metres < 1_000_000)).astype("Int32")
+    bucket = pd.cut(metres.astype(float), bins=DISTANCE_BINS, labels=DISTANCE_LABELS, right=False)
+
+    tipo = map_categories(df["tipo"], lambda s: s.str.strip().str.lower())
+    surface = map_categories(tipo, lambda s: s.map(SURFACES).fillna("otros"))
+    return df.assign(
+        fecha=fecha,
+        distancia_m=metres,
+        distancia_cat=bucket.astype(pd.CategoricalDtype(DISTANCE_LABELS, ordered=True)),
+        tipo=tipo.astype("category"),
+        superficie=surface.astype(pd.CategoricalDtype(SURFACE_LABELS)),
+    )
+
+
+def race_year(races):
+    """The race's own year from `fecha`; the scrape partition `año` only when the date is unknown.
+
+    Runedia partitions list races of later years too, and deduplication keeps the latest
+    partition, so `año` is often not the year the race was run.
+    """
+    return races["fecha"].dt.year.fillna(races["año"]).astype(int)
+
 
 # === Combine all race files into a single dataset ===
-def combine_runedia_races():
-    folder_path = r"C:\Users\evaru\Downloads\EVOLVE\python\running-trends\data\raw\runedia"
-    expected_columns = ['dia', 'mes', 'titulo', 'enlace', 'localidad', 'tipo', 'distancia', 'provincia', 'año']
+def combine_runedia_races(source="csv"):
+    folder_path = get_paths().raw_file("runedia")
     all_dfs = []
 
-    for file in os.listdir(folder_path):
-        if file.endswith(".csv"):
-            path = os.path.join(folder_path, file)
-            try:
-                df = pd.read_csv(path)
-                if len(df.columns) == 1:
-                    df = pd.read_csv(path, sep=";")
-                if not df.empty and list(df.columns[:9]) == expected_columns:
-                    all_dfs.append(df)
-            except Exception as e:
-                print(f"Error reading {file}: {e}")
+    if source == "parquet":
+        all_dfs.append(load_race_dataset()[RACE_COLUMNS])
+    else:
+        races, rejected = load_race_files(folder_path)
+        for row in rejected.itertuples():
+            print(f"Skipped {row.file}: {row.reason}")
+        if not races.empty:
+            all_dfs.append(races)
 
     if all_dfs:
         combined_df = pd.concat(all_dfs, ignore_index=True)
-        combined_df = combined_df.drop_duplicates().dropna()
+        record(rows_in=len(combined_df))
+        combined_df = dedupe_races(add_race_id(combined_df)).dropna()
+        combined_df = normalize_races(combined_df)
 
-        output_path = r"C:\Users\evaru\Downloads\EVOLVE\python\running-trends\data\processed\races_dataset.csv"
+        output_path = get_paths().processed_file("races_dataset.csv")
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
         combined_df.to_csv(output_path, index=False)
+        record(rows_out=len(combined_df))
         print(f"Race dataset saved to: {output_path}")
+
+        index = RaceIdIndex(get_paths().processed_file("race_ids.npy"))
+        index.ids = np.unique(combined_df["race_id"].to_numpy(dtype=np.int64))
+        index.save()
     else:
         print("No valid race files found.")
 
 
+# === CCAA key registry ===
+# Every source spells the regions differently; all of them resolve to one categorical key here
+CCAA_NAMES = [
+    "Andalucia", "Aragon", "Asturias", "Baleares", "Canarias", "Cantabria", "CastillaLeon",
+    "CastillaLaMancha", "Catalunya", "ComunidadValenciana", "Extremadura", "Galicia", "Madrid",
+    "Murcia", "Navarra", "PaisVasco", "LaRioja", "Ceuta", "Melilla", "Total_Nacional",
+]
+CCAA_DTYPE = pd.CategoricalDtype(CCAA_NAMES)
+
+GDP_CCAA = {
+    "Andalucía [+]": "Andalucia", "Aragón [+]": "Aragon", "Asturias [+]": "Asturias",
+    "Canarias [+]": "Canarias", "Cantabria [+]": "Cantabria", "Castilla y León [+]": "CastillaLeon",
+    "Castilla-La Mancha [+]": "CastillaLaMancha", "Cataluña [+]": "Catalunya", "Ceuta [+]": "Ceuta",
+    "Comunidad Valenciana [+]": "ComunidadValenciana", "Comunidad de Madrid [+]": "Madrid",
+    "Extremadura [+]": "Extremadura", "Galicia [+]": "Galicia", "Islas Baleares [+]": "Baleares",
+    "La Rioja [+]": "LaRioja", "Melilla [+]": "Melilla", "Navarra [+]": "Navarra",
+    "País Vasco [+]": "PaisVasco", "Región de Murcia [+]": "Murcia", "Total Nacional": "Total_Nacional",
+}
+INE_CCAA = {
+    "01 Andalucía": "Andalucia", "02 Aragón": "Aragon", "03 Asturias, Principado de": "Asturias",
+    "05 Canarias": "Canarias", "06 Cantabria": "Cantabria", "07 Castilla y León": "CastillaLeon",
+    "08 Castilla - La Mancha": "CastillaLaMancha", "09 Cataluña": "Catalunya", "18 Ceuta": "Ceuta",
+    "10 Comunitat Valenciana": "ComunidadValenciana", "13 Madrid, Comunidad de": "Madrid",
+    "11 Extremadura": "Extremadura", "12 Galicia": "Galicia", "04 Balears, Illes": "Baleares",
+    "17 Rioja, La": "LaRioja", "19 Melilla": "Melilla", "15 Navarra, Comunidad Foral de": "Navarra",
+    "16 País Vasco": "PaisVasco", "14 Murcia, Región de": "Murcia", "Total Nacional": "Total_Nacional",
+}
+TRENDS_CCAA = {
+    "Andalucía": "Andalucia", "Aragón": "Aragon", "Principado de Asturias": "Asturias",
+    "Castilla y León": "CastillaLeon", "Castilla-La Mancha": "CastillaLaMancha", "Cataluña": "Catalunya",
+    "Comunidad Valenciana": "ComunidadValenciana", "Comunidad de Madrid": "Madrid",
+    "Islas Baleares": "Baleares", "La Rioja": "LaRioja", "País Vasco": "PaisVasco", "Región de Murcia": "Murcia",
+}
+RUNEDIA_CCAA = {
+    "andalucia": "Andalucia", "aragon": "Aragon", "asturias": "Asturias", "illes-balears": "Baleares",
+    "canarias": "Canarias", "cantabria": "Cantabria", "castilla-y-leon": "CastillaLeon",
+    "castilla-la-mancha": "CastillaLaMancha", "catalunya": "Catalunya", "valencia": "ComunidadValenciana",
+    "extremadura": "Extremadura", "galicia": "Galicia", "madrid": "Madrid", "murcia": "Murcia",
+    "navarra": "Navarra", "euskadi": "PaisVasco", "la-rioja": "LaRioja", "ceuta": "Ceuta", "melilla": "Melilla",
+}
+CCAA_ALIASES = {**{name: name for name in CCAA_NAMES}, **GDP_CCAA, **INE_CCAA, **TRENDS_CCAA, **RUNEDIA_CCAA}
+
+def ccaa_key(names):
+    """Resolve any spelling of a region to the shared CCAA categorical; unknown names become NaN."""
+    names = pd.Series(names)
+    key = map_categories(names, lambda s: s.str.strip().map(CCAA_ALIASES))
+    unknown = names[key.isna() & names.notna()].unique()
+    if len(unknown):
+        print(f"Unknown CCAA names ignored: {sorted(unknown)}")
+    return key.astype(CCAA_DTYPE)
+
+
+# === Socioeconomic sources, each harmonized to one row per (Año, CCAA) ===
+SOCIO_KEYS = ["Año", "CCAA"]
+
+def keyed(df):
+    # Keep the first row of a key, as the notebook's drop_duplicates after the merges did
+    df = df[df["CCAA"].notna()].drop_duplicates(subset=SOCIO_KEYS)
+    return df.set_index(SOCIO_KEYS)
+
+# gdp_dataset.csv holds GDP in M€ and €; the socioeconomic dataset has always carried both in
+# thousands (the notebook read "152.247 M€" as 152.247), so they are rescaled to keep its units
+GDP_SCALE = 1000
+
+def spanish_number(values):
+    """Parse Spanish-formatted amounts ("152.247 M€", "25.430 €", "-1,5%") to float64; blanks become NaN."""
+    text = values.astype("string").str.replace(r"[\s\xa0]|M€|€|%", "", regex=True)
+    text = text.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    return pd.to_numeric(text.replace("", pd.NA), errors="coerce").astype("float64")
+
+def read_gdp(paths):
+    df = pd.read_csv(paths.processed_file("gdp_dataset.csv"), sep=";")
+    df["Año"] = df["Año"].astype(int)
+    df["CCAA"] = ccaa_key(df["CCAA"])
+    for col in ["PIB_anual", "PIB_capita"]:
+        # Files written before the scraper typed its output still hold the raw page text
+        values = df[col] if pd.api.types.is_numeric_dtype(df[col]) else spanish_number(df[col])
+        df[col] = values / GDP_SCALE
+    return keyed(df[SOCIO_KEYS + ["PIB_anual", "PIB_capita"]])
+
+def read_renta(paths):
+    df = pd.read_csv(paths.raw_file("RentaESP-ccaa.csv"), sep=";")
+    df = df.rename(columns={"Periodo": "Año", "Comunidades y Ciudades Autónomas": "CCAA"})
+    df["CCAA"] = ccaa_key(df["CCAA"])
+    df = df[df["CCAA"].notna()]
+    wide = df.pivot(index=SOCIO_KEYS, columns="Renta anual neta media por persona y por unidad de consumo", values="Total")
+    wide.columns.name = None
+    return wide
+
+UNEMPLOYMENT_AGGREGATES = ("quarter", "mean", "last")
+
+def read_ine_unemployment(path, sexo="Ambos sexos", edad="Total", block_size=1 << 20):
+    """Stream an INE unemployment-rate CSV, keeping only the rows for one sex and age group.
+
+    The file is parsed in blocks and each block is filtered before the next one is read, so memory
+    follows the rows kept rather than the size of the file. Returns CCAA (raw INE name), Año and
+    Trimestre as ints (from "2024T4"), and Total_paro as float (INE's "10,61"; ".." is missing).
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pv
+    reader = pv.open_csv(
+        path,
+        read_options=pv.ReadOptions(block_size=block_size),
+        parse_options=pv.ParseOptions(delimiter=";"),
+        convert_options=pv.ConvertOptions(
+            include_columns=["Sexo", "Comunidades y Ciudades Autónomas", "Edad", "Periodo", "Total"],
+            column_types={"Total": pa.float64()},
+            decimal_point=",",
+            null_values=["..", ""],
+            strings_can_be_null=False,
+        ),
+    )
+    kept = ["Comunidades y Ciudades Autónomas", "Periodo", "Total"]
+    batches = []
+    for batch in reader:
+        keep = pc.and_(pc.equal(batch.column("Sexo"), sexo), pc.equal(batch.column("Edad"), edad))
+        batches.append(batch.filter(keep).select(kept))
+    schema = pa.schema([reader.schema.field(col) for col in kept])
+    df = pa.Table.from_batches(batches, schema=schema).to_pandas()
+    df.columns = ["CCAA", "Periodo", "Total_paro"]
+    period = df.pop("Periodo").str.extract(r"^(\d{4})T([1-4])$")
+    df.insert(0, "Año", period[0].astype("int16"))
+    df.insert(1, "Trimestre", period[1].astype("int8"))
+    return df
+
+def read_unemployment(paths, aggregate="last"):
+    """Unemployment rate per CCAA, aggregated by `aggregate`.
+
+    quarter: one row per (Año, Trimestre, CCAA). mean: the annual mean of the quarters published.
+    last: the latest quarter of each year, the value the original notebook ended up keeping.
+    """
+    if aggregate not in UNEMPLOYMENT_AGGREGATES:
+        raise ValueError(f"aggregate must be one of {UNEMPLOYMENT_AGGREGATES}, got {aggregate!r}")
+    df = read_ine_unemployment(paths.raw_file("tasaparoESP-ccaa.csv"))
+    df["CCAA"] = ccaa_key(df["CCAA"])
+    df = df[df["CCAA"].notna()]
+    if aggregate == "quarter":
+        return df.set_index(["Año", "Trimestre", "CCAA"]).sort_index()
+    if aggregate == "mean":
+        return df.groupby(SOCIO_KEYS, observed=True)[["Total_paro"]].mean()
+    df = df.sort_values("Trimestre", ascending=False, kind="stable")
+    return keyed(df[SOCIO_KEYS + ["Total_paro"]])
+
+def read_trends(paths):
+    df = load_trends(paths)[SOCIO_KEYS + ["busquedas_running"]]
+    df["CCAA"] = df["CCAA"].astype(CCAA_DTYPE)
+    return keyed(df)
+
+def build_socioeconomic_data(paths=None, unemployment="last"):
+    """Join GDP, income, unemployment and Google Trends on their (Año, CCAA) index in one step.
+
+    GDP defines the rows; the other sources are left-joined onto it. `unemployment` is "last" or
+    "mean" (see `read_unemployment`).
+    """
+    if unemployment == "quarter":
+        raise ValueError("the socioeconomic dataset is annual; use unemployment='last' or 'mean'")
+    paths = paths or get_paths()
+    gdp = read_gdp(paths)
+    joined = gdp.join([read_renta(paths), read_unemployment(paths, unemployment), read_trends(paths)], how="left")
+    joined = joined.reset_index()
+    joined["CCAA"] = joined["CCAA"].astype(str)
+    return joined
+
+def merge_socioeconomic_sources(paths=None):
+    """The notebook's original chain of merges, kept as the reference for `benchmark_socioeconomic_build`."""
+    paths = paths or get_paths()
+
+    # GDP is typed and keyed at extraction time, so the chain starts from the parsed table
+    complete_df = read_gdp(paths).reset_index()
+    complete_df["CCAA"] = complete_df["CCAA"].astype(str)
+
+    renta_df = pd.read_csv(paths.raw_file("RentaESP-ccaa.csv"), sep=";")
+    renta_df = renta_df.pivot(
+        index=["Periodo", "Comunidades y Ciudades Autónomas"],
+        columns="Renta anual neta media por persona y por unidad de consumo",
+        values="Total",
+    ).reset_index().rename(columns={"Periodo": "Año", "Comunidades y Ciudades Autónomas": "CCAA"})
+    renta_df.columns.name = None
+    renta_df["CCAA"] = renta_df["CCAA"].replace(INE_CCAA)
+    complete_df = pd.merge(complete_df, renta_df, on=["Año", "CCAA"], how="left")
+
+    unemployment_df = pd.read_csv(paths.raw_file("tasaparoESP-ccaa.csv"), sep=";")
+    unemployment_df = unemployment_df[(unemployment_df["Sexo"] == "Ambos sexos") & (unemployment_df["Edad"] == "Total")]
+    unemployment_df = unemployment_df.rename(columns={"Comunidades y Ciudades Autónomas": "CCAA", "Periodo": "Año", "Total": "Total_paro"})
+    unemployment_df["Año"] = unemployment_df["Año"].astype(str).str[:4].astype(int)
+    unemployment_df["Total_paro"] = unemployment_df["Total_paro"].astype(str).str.replace(",", ".").astype(float)
+    unemployment_df["CCAA"] = unemployment_df["CCAA"].replace(INE_CCAA)
+    complete_df["Año"] = complete_df["Año"].astype(int)
+    complete_df = pd.merge(complete_df, unemployment_df[["Año", "CCAA", "Total_paro"]], on=["Año", "CCAA"], how="left")
+
+    folder_csv = paths.raw_file("google-trends")
+    dfs = []
+    for file in os.listdir(folder_csv):
+        if file.endswith(".csv"):
+            df = pd.read_csv(os.path.join(folder_csv, file), skiprows=1)
+            df.columns = ["Región", "Busqueda_running"]
+            df["Año"] = int(os.path.splitext(file)[0])
+            dfs.append(df)
+    trends_df = pd.concat(dfs, ignore_index=True).pivot(index="Región", columns="Año", values="Busqueda_running")
+    trends_df.columns = [f"busquedas_{col}" for col in trends_df.columns]
+    trends_df = trends_df.reset_index().melt(id_vars="Región", var_name="Año", value_name="busquedas_running")
+    trends_df["Año"] = trends_df["Año"].str.extract(r"(\d{4})").astype(int)
+    trends_df = trends_df.rename(columns={"Región": "CCAA"})
+    trends_df["CCAA"] = trends_df["CCAA"].replace(TRENDS_CCAA)
+    complete_df = pd.merge(complete_df, trends_df, on=["Año", "CCAA"], how="left")
+    return complete_df.drop_duplicates(subset=["Año", "CCAA"])
+
+
+# === Clean the socioeconomic dataset for Power BI ===
+def remove_outliers_iqr(data, column):
+    q1 = data[column].quantile(0.25)
+    q3 = data[column].quantile(0.75)
+    iqr = q3 - q1
+    return data[(data[column] >= q1 - 1.5 * iqr) & (data[column] <= q3 + 1.5 * iqr)]
+
+def quantile_groups(df, columns, by="Año", quantiles=(0.25, 0.75), labels=("Low", "Medium", "High")):
+    """Label every row of each indicator by where it falls among the quantiles of its `by` group.
+
+    `columns` maps output names to indicator columns (a list labels them "<column>_Group").
+    `quantiles` is a sequence of cut points or a number of equal-frequency bins; `labels` needs
+    one more entry than there are cut points. Bins are closed on the left, except that a value
+    equal to the top threshold stays in the bin below it, so with the defaults: Low below the
+    25th percentile, High above the 75th, Medium in between. Rows with a missing value or a missing
+    `by` get no label.
+    """
+    if isinstance(columns, (list, tuple)):
+        columns = {f"{col}_Group": col for col in columns}
+    if isinstance(quantiles, int):
+        quantiles = np.linspace(0, 1, quantiles + 1)[1:-1]
+        if labels is None or len(labels) != len(quantiles) + 1:
+            labels = [f"Q{i}" for i in range(1, len(quantiles) + 2)]
+    quantiles = list(quantiles)
+    if len(labels) != len(quantiles) + 1:
+        raise ValueError(f"{len(quantiles)} cut points need {len(quantiles) + 1} labels, got {len(labels)}")
+
+    # All thresholds of all indicators in one grouped quantile, then broadcast back to the rows
+    indicators = list(dict.fromkeys(columns.values()))
+    codes, groups = pd.factorize(df[by])
+    thresholds = df.groupby(codes)[indicators].quantile(quantiles).unstack()
+
+    result = {}
+    for name, col in columns.items():
+        cuts = thresholds[col].reindex(range(len(groups))).to_numpy()[codes]     # rows x cut points
+        values = df[col].to_numpy(dtype=float)[:, None]
+        index = (values >= cuts[:, :-1]).sum(axis=1) + (values[:, 0] > cuts[:, -1])
+        # Rows with a missing value or a missing `by` (code -1, which would index the last group) get no label
+        index = np.where(np.isnan(values[:, 0]) | (codes == -1), -1, index)
+        result[name] = pd.Categorical.from_codes(index, categories=list(labels), ordered=True)
+    return pd.DataFrame(result, index=df.index)
+
+def clean_socioeconomic_data(df):
+    """IQR outlier removal and yearly quartile groups, as done in the cleaning notebook."""
+    cleaned = df.copy()
+    for col in ["Renta neta media por persona", "Total_paro", "busquedas_running"]:
+        cleaned = remove_outliers_iqr(cleaned, col)
+    groups = quantile_groups(cleaned, {"Income_Group": "Renta neta media por persona",
+                                       "Unemp_Group": "Total_paro", "Search_Group": "busquedas_running"})
+    return pd.concat([cleaned, groups], axis=1)
+
+def combine_socioeconomic_data():
+    joined = build_socioeconomic_data()
+    cleaned = clean_socioeconomic_data(joined)
+    record(rows_in=len(joined), rows_out=len(cleaned))
+    output_path = get_paths().processed_file("running_trends_cleaned_for_powerbi.csv")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    cleaned.to_csv(output_path, index=False)
+    print(f"Socioeconomic dataset saved to: {output_path}")
+
+def benchmark_socioeconomic_build(repeat=5):
+    """Time the single-pass build against the merge chain and check both give the same table."""
+    import time
+    builders = {"merge chain": merge_socioeconomic_sources, "single pass": build_socioeconomic_data}
+    results = {}
+    for name, builder in builders.items():
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            df = builder()
+            timings.append(time.perf_counter() - started)
+        results[name] = clean_socioeconomic_data(df).reset_index(drop=True)
+        print(f"{name:12s} best {min(timings) * 1000:7.1f} ms over {repeat} runs ({len(df)} rows)")
+    reference, candidate = results.values()
+    pd.testing.assert_frame_equal(reference, candidate, check_dtype=False)
+    print("Both builds produce the same cleaned dataset")
+
+
+# === Federation licence history (CSD "Histórico de licencias") ===
+# The sheet is split into blocks of years, each starting with its own "nº,FEDERACIÓN,..." header
+# row; the year columns are padded with blank spacer columns that move from block to block, and
+# the last block shifts the federation name one column to the right.
+RUNNING_FEDERATION = "ATLETISMO"
+
+def federation_name(names):
+    """Canonical federation key: footnote marks, accents on vowels and ", DEP. DE" suffixes removed."""
+    import unicodedata
+    def canonical(s):
+        s = s.str.replace(r"\((?:\d+|\*)\)", "", regex=True).str.replace(r",\s*DEP\.\s*DE$", "", regex=True)
+        s = s.str.replace(r"\s+", " ", regex=True).str.strip().str.upper()
+        # Drop the acute accent only, so TRIATLÓN == TRIATLON but MONTAÑA keeps its Ñ
+        return s.map(lambda name: unicodedata.normalize("NFC", unicodedata.normalize("NFD", name).replace("\u0301", "")))
+    return map_categories(names, canonical)
+
+def parse_licences(path):
+    """Reshape the licence sheet into a tidy (federacion, Año, licencias) table."""
+    raw = pd.read_csv(path, header=None, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+    raw.columns = range(raw.shape[1])
+    is_header = raw[0].str.strip() == "nº"
+    block = is_header.cumsum().to_numpy()
+
+    # Year of every (block, column) cell, NaN for spacer columns
+    headers = raw[is_header]
+    years = np.full((len(headers) + 1, raw.shape[1]), np.nan)
+    years[1:] = headers.apply(lambda col: pd.to_numeric(col.str.strip(), errors="coerce")).to_numpy()
+    years[:, :3] = np.nan
+
+    name = raw[1].where(raw[1].str.strip() != "", raw[2])
+    federation_rows = (block > 0) & ~is_header & (raw[0].str.strip() != "TOTALES") & (name.str.strip() != "")
+    values = raw.loc[federation_rows].to_numpy()
+    rows, cols = np.nonzero((values != "") & ~np.isnan(years[block[federation_rows]]))
+
+    tidy = pd.DataFrame({
+        "federacion": federation_name(pd.Series(name[federation_rows].to_numpy()[rows])),
+        "Año": years[block[federation_rows][rows], cols].astype("int16"),
+        "licencias": pd.to_numeric(pd.Series(values[rows, cols]).str.replace(".", "", regex=False).str.strip()),
+    })
+    # A federation appears once per block, but renamed federations can collapse onto one key
+    tidy = tidy.groupby(["federacion", "Año"], as_index=False, observed=True)["licencias"].sum()
+    tidy["federacion"] = tidy["federacion"].astype("category")
+    tidy["licencias"] = tidy["licencias"].astype("int64")
+    return tidy
+
+def load_licences(paths=None):
+    """Tidy licence table, parsed once per version of licencias-ESP.csv and then read from the cache."""
+    paths = paths or get_paths()
+    source = paths.raw_file("licencias-ESP.csv")
+    return cached_parquet([source], "licencias", lambda: parse_licences(source), paths=paths)
+
+
+# === Google Trends, on one scale across years ===
+# Every yearly export ("Región,running: (YYYY)") is indexed to that year's top region = 100, so a
+# 90 in 2010 and a 90 in 2020 are not the same amount of interest. A national "interest over
+# time" export for Spain (one index for the whole 2004-2024 range) fixes the level of every year:
+# each year's regional indices are scaled so that their mean matches the national index of that
+# year. Without the anchor file the within-year index is kept as it is.
+TRENDS_ANCHOR = "google-trends-national.csv"
+
+def parse_trends(folder):
+    """All yearly regional exports of `folder` as one (CCAA, Año, busquedas_running) table."""
+    # The exports are tiny; the csv module avoids a read_csv call per file
+    rows = []
+    for file in sorted(os.listdir(folder)):
+        if file.endswith(".csv"):
+            year = int(os.path.splitext(file)[0])
+            with open(os.path.join(folder, file), encoding="utf-8-sig", newline="") as f:
+                lines = [row for row in csv.reader(f) if row]
+            rows.extend((region, year, value) for region, value in lines[2:])
+    df = pd.DataFrame(rows, columns=["CCAA", "Año", "busquedas_running"])
+    df["busquedas_running"] = pd.to_numeric(df["busquedas_running"], errors="coerce")
+    df["CCAA"] = ccaa_key(df["CCAA"])
+    return df
+
+def parse_trends_anchor(path):
+    """Yearly mean of a national interest-over-time export ("Mes,running: (España)" rows)."""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        rows = [row for row in csv.reader(f) if len(row) == 2 and row[0][:4].isdigit()]
+    df = pd.DataFrame(rows, columns=["periodo", "nacional"])
+    # Trends writes "<1" for interest that rounds to zero
+    df["nacional"] = pd.to_numeric(df["nacional"].replace("<1", "0.5"), errors="coerce")
+    df["Año"] = df["periodo"].str[:4].astype(int)
+    return df.groupby("Año")["nacional"].mean()
+
+def rescale_trends(df, anchor=None):
+    """Add `interes`, the regional index on the anchor's cross-year scale (the raw index without one)."""
+    if anchor is None:
+        return df.assign(interes=df["busquedas_running"].astype(float))
+    regional_mean = df.groupby("Año")["busquedas_running"].transform("mean")
+    national = df["Año"].map(anchor)
+    return df.assign(interes=df["busquedas_running"] * national / regional_mean)
+
+def load_trends(paths=None):
+    """Tidy (CCAA, Año, busquedas_running, interes) table of every Trends export, cached per version of the files."""
+    paths = paths or get_paths()
+    folder = paths.raw_file("google-trends")
+    anchor_path = paths.raw_file(TRENDS_ANCHOR)
+    sources = [os.path.join(folder, file) for file in sorted(os.listdir(folder)) if file.endswith(".csv")]
+    if os.path.exists(anchor_path):
+        sources.append(anchor_path)
+
+    def build():
+        anchor = parse_trends_anchor(anchor_path) if os.path.exists(anchor_path) else None
+        if anchor is None:
+            print(f"No {TRENDS_ANCHOR}: Trends interest stays on each year's own 0-100 scale")
+        tidy = rescale_trends(parse_trends(folder).dropna(subset=["CCAA"]), anchor)
+        return tidy.astype({"CCAA": str, "Año": "int16"}).sort_values(["CCAA", "Año"], kind="stable", ignore_index=True)
+
+    return cached_parquet(sources, "google-trends", build, paths=paths)
+
+def combine_trends():
+    output_path = get_paths().processed_file("google_trends.csv")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    tidy = load_trends()
+    tidy.to_csv(output_path, index=False)
+    record(rows_out=len(tidy))
+    print(f"Google Trends table saved to: {output_path}")
+
+
+# === Pre-aggregated race cube for the dashboard ===
+# Race counts by (Año, CCAA, superficie, distancia_cat, mes) with the socioeconomic measures of
+# the region and year attached, stored as Parquet partitioned by year with dictionary-encoded
+# dimensions. Each year partition is only rewritten when its races or socio rows change.
+CUBE_DIMENSIONS = ["Año", "CCAA", "superficie", "distancia_cat", "mes"]
+CUBE_MEASURES = [
+    "PIB_capita", "Renta neta media por persona", "Total_paro", "busquedas_running",
+    "Income_Group", "Unemp_Group", "Search_Group",
+]
+
+def content_hash_by(df, key):
+    """One order-independent hash per value of `key`, summed from per-row hashes."""
+    rows = pd.util.hash_pandas_object(df.drop(columns=[key]), index=False).to_numpy()
+    sums = pd.Series(rows, index=df[key].to_numpy()).groupby(level=0).sum()
+    return {int(k): format(int(v), "016x") for k, v in sums.items()}
+
+def aggregate_cube(races, socio):
+    # Races with an unknown surface, distance or month still count, under a missing dimension value
+    counts = races.groupby(CUBE_DIMENSIONS, observed=True, dropna=False).size().rename("num_carreras").reset_index()
+    cube = counts.merge(socio, on=["Año", "CCAA"], how="left")
+    for col in ["CCAA", "superficie", "distancia_cat", "mes", "Income_Group", "Unemp_Group", "Search_Group"]:
+        cube[col] = cube[col].astype("category")
+    return cube
+
+def build_race_cube(force=False):
+    """Build or refresh the race cube under processed/race_cube/año=YYYY/.
+
+    A manifest stores a content hash of each year's races and socio rows; only years whose hash
+    changed are re-aggregated and rewritten, and years that no longer have races are removed.
+    Returns the list of rewritten years.
+    """
+    import json
+    import shutil
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    paths = get_paths()
+    cube_dir = paths.processed_file("race_cube")
+    manifest_path = os.path.join(cube_dir, "_manifest.json")
+
+    races = pd.read_csv(paths.processed_file("races_dataset.csv"),
+                        usecols=["provincia", "año", "mes", "fecha", "superficie", "distancia_cat"],
+                        dtype={"provincia": "category", "mes": pd.CategoricalDtype(MONTHS),
+                               "superficie": "category", "distancia_cat": pd.CategoricalDtype(DISTANCE_LABELS)},
+                        parse_dates=["fecha"])
+    races["Año"] = race_year(races)
+    races["CCAA"] = ccaa_key(races["provincia"])
+    races = races.drop(columns=["provincia", "año", "fecha"])
+    socio = pd.read_csv(paths.processed_file("running_trends_cleaned_for_powerbi.csv"),
+                        usecols=["Año", "CCAA"] + CUBE_MEASURES)
+    socio["CCAA"] = ccaa_key(socio["CCAA"])
+
+    race_hashes = content_hash_by(races, "Año")
+    socio_hashes = content_hash_by(socio, "Año")
+    fingerprints = {year: race_hashes[year] + socio_hashes.get(year, "") for year in race_hashes}
+
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            previous = {int(k): v for k, v in json.load(f).items()}
+    except (OSError, ValueError):
+        previous = {}
+    changed = sorted(year for year, fingerprint in fingerprints.items()
+                     if force or previous.get(year) != fingerprint
+                     or not os.path.exists(os.path.join(cube_dir, f"Año={year}")))
+
+    if changed:
+        cube = aggregate_cube(races[races["Año"].isin(changed)], socio[socio["Año"].isin(changed)])
+        record(rows_in=races["Año"].isin(changed).sum(), rows_out=len(cube))
+        for year, part in cube.groupby("Año"):
+            table = pa.Table.from_pandas(part.drop(columns=["Año"]), preserve_index=False)
+            with atomic_path(os.path.join(cube_dir, f"Año={year}", "part-0.parquet")) as tmp:
+                pq.write_table(table, tmp, compression="zstd")
+    for year in set(previous) - set(fingerprints):
+        shutil.rmtree(os.path.join(cube_dir, f"Año={year}"), ignore_errors=True)
+
+    write_json(manifest_path, {str(year): fingerprint for year, fingerprint in sorted(fingerprints.items())}, indent=2)
+    print(f"Race cube saved to: {cube_dir} ({len(changed)} of {len(fingerprints)} years rebuilt)")
+    return changed
+
+
 # === Combine all socioeconomic data into a single dataset ===
 def create_combined_powerbi_dataset():
-    socio_path = r"C:\Users\evaru\Downloads\EVOLVE\python\running-trends\data\processed\running_trends_cleaned_for_powerbi.csv"
-    race_path = r"C:\Users\evaru\Downloads\EVOLVE\python\running-trends\data\processed\races_dataset.csv"
+    socio_path = get_paths().processed_file("running_trends_cleaned_for_powerbi.csv")
+    race_path = get_paths().processed_file("races_dataset.csv")
 
     socio_df = pd.read_csv(socio_path, sep=",")
-    race_df = pd.read_csv(race_path, sep=",")
+    race_df = pd.read_csv(race_path, sep=",", usecols=["provincia", "año", "fecha"], parse_dates=["fecha"])
 
-    # Clean and align columns
+    # Runedia slugs ("castilla-y-leon") and socioeconomic names ("CastillaLeon") meet on the CCAA key
+    socio_df["ccaa"] = ccaa_key(socio_df["CCAA"])
+    race_df["ccaa"] = ccaa_key(race_df["provincia"])
     socio_df["CCAA"] = socio_df["CCAA"].str.strip().str.lower()
-    race_df["provincia"] = race_df["provincia"].str.strip().str.lower()
     socio_df["Año"] = socio_df["Año"].astype(int)
-    race_df["año"] = race_df["año"].astype(int)
+    race_df["Año"] = race_year(race_df)
 
-    # Rename to join properly
-    race_df = race_df.rename(columns={"provincia": "ccaa", "año": "Año"})
-
-    # Count races per year and region
-    race_counts = race_df.groupby(["Año", "ccaa"], as_index=False).size().rename(columns={"size": "num_carreras"})
+    # Count races per year and region, by the year each race was run (as the race cube does)
+    race_counts = race_df.groupby(["Año", "ccaa"], observed=True).size().rename("num_carreras").reset_index()
 
     # Merge
-    merged_df = pd.merge(socio_df, race_counts, how="left", left_on=["Año", "CCAA"], right_on=["Año", "ccaa"])
-    merged_df["num_carreras"] = merged_df["num_carreras"].fillna(0).astype(int)
-    merged_df = merged_df.drop(columns=["ccaa"])  # clean up duplicate
+    merged_df = pd.merge(socio_df, race_counts, how="left", on=["Año", "ccaa"])
+    # A region-year without a single race points at a join or scrape problem (the Baleares and
+    # Catalunya pages only hold a generic listing), not at a quiet year, so it stays missing
+    merged_df["num_carreras"] = merged_df["num_carreras"].astype("Int64")
+    without_races = merged_df[merged_df["num_carreras"].isna()].groupby("ccaa", observed=True)["Año"].agg(list)
+    for ccaa, years in without_races.items():
+        print(f"Warning: no races for {ccaa} in {len(years)} years, left empty: {years}")
+    merged_df = merged_df.drop(columns=["ccaa"])  # clean up join key
+
+    # National athletics federation licences, a participation signal shared by every region of a year
+    licences = load_licences()
+    licences = licences[licences["federacion"] == RUNNING_FEDERATION]
+    licences = licences[["Año", "licencias"]].rename(columns={"licencias": "licencias_atletismo"})
+    merged_df = pd.merge(merged_df, licences.astype({"Año": int}), how="left", on="Año")
+    merged_df["licencias_atletismo"] = merged_df["licencias_atletismo"].astype("Int64")
+    record(rows_in=len(socio_df) + len(race_df), rows_out=len(merged_df))
 
     # Save result
-    output_path = r"C:\Users\evaru\Downloads\EVOLVE\python\running-trends\data\processed\powerbi_combined_dataset.csv"
+    output_path = get_paths().processed_file("powerbi_combined_dataset.csv")
     merged_df.to_csv(output_path, index=False)
     print(f" Combined Power BI dataset saved to: {output_path}")
 
 
 if __name__ == "__main__":
-    combine_runedia_races()
-    create_combined_powerbi_dataset()
+    if sys.argv[1:2] == ["benchmark"]:
+        benchmark_socioeconomic_build()
+    else:
+        combine_runedia_races()
+        combine_socioeconomic_data()
+        combine_trends()
+        create_combined_powerbi_dataset()
+        build_race_cube()
@@ -1,120 +1,245 @@
+# === CHARTS ===
+# Every chart is registered with a `prepare` step, which reduces the datasets to the few rows it
+# plots, and a `draw` step, which plots them. Preparing is cheap pandas work done up front;
+# drawing happens in a process pool on the non-interactive Agg backend. A chart is only redrawn
+# when the hash of its prepared data, its spec or its code has changed since the last render.
+#
+#   python src/visualization.py                     # print the hypothesis tests, render what changed
+#   python src/visualization.py --force h3_pib_vs_races
+
+import argparse
+import hashlib
+import inspect
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.preprocessing import MinMaxScaler
-from scipy.stats import pearsonr
+from cache import atomic_path, write_json
+from config import get_paths
+from instrumentation import record
+
+CHARTS = {}
+
+
+@dataclass
+class Chart:
+    name: str
+    source: str                 # "socio" or "races", see SOURCES
+    prepare: callable
+    draw: callable = None
+    spec: dict = field(default_factory=dict)
+
+    @property
+    def filename(self):
+        return f"{self.name}.png"
 
-# === Load dataset ===
-df = pd.read_csv(r"C:\Users\evaru\Downloads\EVOLVE\python\running-trends\data\processed\powerbi_combined_dataset.csv", sep=",")
-df = df.drop_duplicates(subset=["Año", "CCAA"])
 
-# === REMOVE OUTLIERS (based on 5% and 95% percentiles) ===
+def chart(name, source, **spec):
+    """Register a chart: decorate its prepare function, then attach a draw function with `.draw`."""
+    def register(prepare):
+        entry = Chart(name, source, prepare, spec={"figsize": (12, 6), "dpi": 300, **spec})
+        CHARTS[name] = entry
+
+        def set_draw(draw):
+            entry.draw = draw
+            return draw
+        prepare.draw = set_draw
+        return prepare
+    return register
+
+
+# === Data sources ===
 def remove_outliers(df, column):
+    # Based on the 5% and 95% percentiles
     p5 = df[column].quantile(0.05)
     p95 = df[column].quantile(0.95)
     return df[(df[column] >= p5) & (df[column] <= p95)]
 
-for col in ["Renta neta media por persona", "Total_paro", "busquedas_running"]:
-    df = remove_outliers(df, col)
+def load_socio(paths):
+    df = pd.read_csv(paths.processed_file("powerbi_combined_dataset.csv"), sep=",")
+    df = df.drop_duplicates(subset=["Año", "CCAA"])
+    for col in ["Renta neta media por persona", "Total_paro", "busquedas_running"]:
+        df = remove_outliers(df, col)
+    return df
+
+def load_races(paths):
+    carreras = pd.read_csv(paths.processed_file("races_dataset.csv"), usecols=["año", "tipo"], dtype={"tipo": "category"})
+    carreras["año"] = carreras["año"].astype(int)
+    return carreras
+
+SOURCES = {"socio": load_socio, "races": load_races}
+
+def min_max(df):
+    # Same result as sklearn's MinMaxScaler, column by column
+    return (df - df.min()) / (df.max() - df.min())
+
 
 # === H1: Higher income, more running interest ===
-evolution = df.groupby("Año")[["Renta neta media por persona", "busquedas_running"]].mean().dropna()
-scaler = MinMaxScaler()
-evolution_scaled = pd.DataFrame(scaler.fit_transform(evolution), columns=evolution.columns, index=evolution.index)
-
-plt.figure(figsize=(12, 6))
-sns.lineplot(data=evolution_scaled, x=evolution_scaled.index, y="Renta neta media por persona", label="Income")
-sns.lineplot(data=evolution_scaled, x=evolution_scaled.index, y="busquedas_running", label="Running searches")
-plt.title("Normalized Income and Running Searches Evolution")
-plt.xlabel("Year")
-plt.ylabel("Normalized value")
-plt.grid(True)
-plt.legend()
-plt.tight_layout()
-plt.savefig("C:/Users/evaru/Downloads/EVOLVE/python/running-trends/images/evolution_income_search.png", dpi=300)
-plt.show()
-
-# === Pearson Correlation for H1: Income vs Running Searches ===
-corr_h1, pval_h1 = pearsonr(evolution["Renta neta media por persona"], evolution["busquedas_running"])
-print(f"\n📈 H1 - Pearson correlation (Income vs Running searches): {corr_h1:.2f} (p-value: {pval_h1:.4f})")
-if pval_h1 < 0.05:
-    print("Podemos dar la hipótesis nula como válida (hay correlación significativa entre ingresos y búsquedas de running).")
-else:
-    print("No tenemos suficiente evidencia para invalidar el contrario a la hipótesis nula.")
+@chart("evolution_income_search", "socio", title="Normalized Income and Running Searches Evolution",
+       labels=("Income", "Running searches"))
+def income_search(df):
+    evolution = df.groupby("Año")[["Renta neta media por persona", "busquedas_running"]].mean().dropna()
+    return min_max(evolution)
+
+@income_search.draw
+def draw_evolution(data, spec, plt, sns):
+    for column, label in zip(data.columns, spec["labels"]):
+        sns.lineplot(data=data, x=data.index, y=column, label=label)
+    plt.title(spec["title"])
+    plt.xlabel("Year")
+    plt.ylabel("Normalized value")
+    plt.grid(True)
+    plt.legend()
+
 
 # === H2: Higher unemployment, less interest in running ===
-unemp_evolution = df.groupby("Año")[["Total_paro", "busquedas_running"]].mean().dropna()
-unemp_scaled = pd.DataFrame(scaler.fit_transform(unemp_evolution), columns=unemp_evolution.columns, index=unemp_evolution.index)
-
-plt.figure(figsize=(12, 6))
-sns.lineplot(data=unemp_scaled, x=unemp_scaled.index, y="Total_paro", label="Unemployment")
-sns.lineplot(data=unemp_scaled, x=unemp_scaled.index, y="busquedas_running", label="Running searches")
-plt.title("Normalized Unemployment and Running Searches Evolution")
-plt.xlabel("Year")
-plt.ylabel("Normalized value")
-plt.grid(True)
-plt.legend()
-plt.tight_layout()
-plt.savefig("C:/Users/evaru/Downloads/EVOLVE/python/running-trends/images/evolution_unemployment_search.png", dpi=300)
-plt.show()
-
-# === Pearson Correlation for H2: Unemployment vs Running Searches ===
-corr_h2, pval_h2 = pearsonr(unemp_evolution["Total_paro"], unemp_evolution["busquedas_running"])
-print(f"\n📉 H2 - Pearson correlation (Unemployment vs Running searches): {corr_h2:.2f} (p-value: {pval_h2:.4f})")
-if pval_h2 < 0.05:
-    print("Podemos dar la hipótesis nula como válida (hay correlación significativa entre desempleo y búsquedas de running).")
-else:
-    print("No tenemos suficiente evidencia para invalidar el contrario a la hipótesis nula.")
+@chart("evolution_unemployment_search", "socio", title="Normalized Unemployment and Running Searches Evolution",
+       labels=("Unemployment", "Running searches"))
+def unemployment_search(df):
+    evolution = df.groupby("Año")[["Total_paro", "busquedas_running"]].mean().dropna()
+    return min_max(evolution)
+
+unemployment_search.draw(draw_evolution)
+
 
 # === H3: Communities with higher GDP host more races ===
-pib_avg = df.groupby("CCAA")["PIB_anual"].mean().reset_index()
-race_total = df.groupby("CCAA")["num_carreras"].sum().reset_index()
-merge_pib_races = pd.merge(pib_avg, race_total, on="CCAA")
-
-plt.figure(figsize=(10, 6))
-sns.regplot(data=merge_pib_races, x="PIB_anual", y="num_carreras", scatter=True, color='teal')
-plt.title("Relation Between GDP and Number of Races")
-plt.xlabel("Average GDP")
-plt.ylabel("Total Races")
-plt.grid(True)
-plt.tight_layout()
-plt.savefig("C:/Users/evaru/Downloads/EVOLVE/python/running-trends/images/h3_pib_vs_races.png", dpi=300)
-plt.show()
-
-corr_h3, pval_h3 = pearsonr(merge_pib_races["PIB_anual"], merge_pib_races["num_carreras"])
-print(f"\n📊 H3 - Pearson correlation (GDP vs Total Races): {corr_h3:.2f} (p-value: {pval_h3:.4f})")
-if pval_h3 < 0.05:
-    print("Podemos dar la hipótesis nula como válida (hay correlación significativa entre PIB y número de carreras).")
-else:
-    print("No tenemos suficiente evidencia para invalidar el contrario a la hipótesis nula.")
+@chart("h3_pib_vs_races", "socio", figsize=(10, 6))
+def pib_races(df):
+    pib_avg = df.groupby("CCAA")["PIB_anual"].mean().reset_index()
+    # Regions without usable race data stay out instead of counting as zero races
+    race_total = df.groupby("CCAA")["num_carreras"].sum(min_count=1).reset_index()
+    return pd.merge(pib_avg, race_total, on="CCAA").dropna()
+
+@pib_races.draw
+def draw_pib_races(data, spec, plt, sns):
+    sns.regplot(data=data, x="PIB_anual", y="num_carreras", scatter=True, color='teal')
+    plt.title("Relation Between GDP and Number of Races")
+    plt.xlabel("Average GDP")
+    plt.ylabel("Total Races")
+    plt.grid(True)
+
 
 # === H4: Race distribution behavior ===
-carreras = pd.read_csv(r"C:\Users\evaru\Downloads\EVOLVE\python\running-trends\data\processed\races_dataset.csv")
-carreras["año"] = carreras["año"].astype(int)
-carreras["provincia"] = carreras["provincia"].str.title()
-carreras["tipo"] = carreras["tipo"].str.lower().str.strip()
-
-# Evolution of total races per year
-carreras_by_year = carreras.groupby("año").size().reset_index(name="total_carreras")
-plt.figure(figsize=(12, 6))
-sns.lineplot(data=carreras_by_year, x="año", y="total_carreras", marker="o")
-plt.title("Number of Races in Spain (2000–2024)")
-plt.xlabel("Year")
-plt.ylabel("Total Races")
-plt.grid(True)
-plt.tight_layout()
-plt.savefig("C:/Users/evaru/Downloads/EVOLVE/python/running-trends/images/h4_races_by_year.png", dpi=300)
-plt.show()
-
-# Top 10 race types
-race_types = carreras["tipo"].value_counts().reset_index()
-race_types.columns = ["tipo", "total"]
-plt.figure(figsize=(10, 6))
-sns.barplot(data=race_types.head(10), x="tipo", y="total", palette="magma")
-plt.title("Top 10 Race Types")
-plt.xlabel("Race Type")
-plt.ylabel("Count")
-plt.xticks(rotation=45)
-plt.tight_layout()
-plt.savefig("C:/Users/evaru/Downloads/EVOLVE/python/running-trends/images/h4_race_types.png", dpi=300)
-plt.show()
+@chart("h4_races_by_year", "races")
+def races_by_year(carreras):
+    return carreras.groupby("año").size().reset_index(name="total_carreras")
+
+@races_by_year.draw
+def draw_races_by_year(data, spec, plt, sns):
+    sns.lineplot(data=data, x="año", y="total_carreras", marker="o")
+    plt.title("Number of Races in Spain (2000–2024)")
+    plt.xlabel("Year")
+    plt.ylabel("Total Races")
+    plt.grid(True)
+
+@chart("h4_race_types", "races", figsize=(10, 6))
+def race_types(carreras):
+    counts = carreras["tipo"].value_counts().reset_index()
+    counts.columns = ["tipo", "total"]
+    return counts.head(10).astype({"tipo": str})
+
+@race_types.draw
+def draw_race_types(data, spec, plt, sns):
+    sns.barplot(data=data, x="tipo", y="total", hue="tipo", palette="magma", legend=False)
+    plt.title("Top 10 Race Types")
+    plt.xlabel("Race Type")
+    plt.ylabel("Count")
+    plt.xticks(rotation=45)
+
+
+# === Rendering ===
+def chart_hash(entry, data):
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    digest.update(json.dumps([list(map(str, data.columns)), entry.spec], sort_keys=True, default=str).encode("utf-8"))
+    digest.update(inspect.getsource(entry.draw).encode("utf-8"))
+    return digest.hexdigest()
+
+def render(name, data, path):
+    """Draw one chart to `path`; runs in a worker process."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    entry = CHARTS[name]
+    plt.figure(figsize=entry.spec["figsize"])
+    entry.draw(data, entry.spec, plt, sns)
+    plt.tight_layout()
+    with atomic_path(path, suffix=".png") as tmp:
+        plt.savefig(tmp, dpi=entry.spec["dpi"])
+    plt.close("all")
+    return name
+
+def render_charts(names=None, force=False, workers=None):
+    """Render the requested charts (all by default), skipping those whose inputs are unchanged.
+
+    Returns the names of the charts that were redrawn.
+    """
+    paths = get_paths()
+    os.makedirs(paths.images, exist_ok=True)
+    state_path = paths.cache_file("charts", "state.json")
+    try:
+        with open(state_path, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+
+    selected = [CHARTS[name] for name in (names or CHARTS)]
+    sources = {source: SOURCES[source](paths) for source in {entry.source for entry in selected}}
+    jobs = {}
+    for entry in selected:
+        data = entry.prepare(sources[entry.source])
+        digest = chart_hash(entry, data)
+        path = paths.image_file(entry.filename)
+        if not force and state.get(entry.name) == digest and os.path.exists(path):
+            print(f"[charts] {entry.name}: up to date")
+            continue
+        jobs[entry.name] = (data, path, digest)
+
+    record(rows_in=sum(len(data) for data, _, _ in jobs.values()), rows_out=len(jobs))
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers or min(len(jobs), os.cpu_count() or 1)) as pool:
+            futures = {pool.submit(render, name, data, path): name for name, (data, path, _) in jobs.items()}
+            for future in futures:
+                name = future.result()
+                state[name] = jobs[name][2]
+                print(f"[charts] {name}: saved to {jobs[name][1]}")
+        write_json(state_path, state, indent=2, sort_keys=True)
+    return list(jobs)
+
+
+# === Hypothesis checks printed alongside the charts ===
+HYPOTHESES = [
+    ("📈 H1", "evolution_income_search", "Income vs Running searches", "ingresos y búsquedas de running"),
+    ("📉 H2", "evolution_unemployment_search", "Unemployment vs Running searches", "desempleo y búsquedas de running"),
+    ("📊 H3", "h3_pib_vs_races", "GDP vs Total Races", "PIB y número de carreras"),
+]
+
+def report_hypotheses():
+    from scipy.stats import pearsonr
+    socio = load_socio(get_paths())
+    for label, name, description, spanish in HYPOTHESES:
+        data = CHARTS[name].prepare(socio)
+        if name == "h3_pib_vs_races":
+            x, y = data["PIB_anual"], data["num_carreras"]
+        else:
+            # Pearson is unaffected by the min-max scaling of the plotted series
+            x, y = data.iloc[:, 0], data.iloc[:, 1]
+        corr, pval = pearsonr(x, y)
+        print(f"\n{label} - Pearson correlation ({description}): {corr:.2f} (p-value: {pval:.4f})")
+        if pval < 0.05:
+            print(f"Podemos dar la hipótesis nula como válida (hay correlación significativa entre {spanish}).")
+        else:
+            print("No tenemos suficiente evidencia para invalidar el contrario a la hipótesis nula.")
+
+
+# === MAIN RUN ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the project charts")
+    parser.add_argument("charts", nargs="*", help=f"charts to render (default: all of {', '.join(CHARTS)})")
+    parser.add_argument("--force", action="store_true", help="redraw even if the inputs are unchanged")
+    parser.add_argument("--workers", type=int, default=None, help="number of rendering processes")
+    args = parser.parse_args()
+    report_hypotheses()
+    render_charts(args.charts or None, force=args.force, workers=args.workers)
@@ -0,0 +1,44 @@
+# Startup budget of the command line: `status` and `--help` must stay cheap enough for cron.
+#
+#   python -m pytest tests
+
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, "running-trends")
+# Whole process, interpreter start-up included; generous enough for a loaded CI machine
+WALL_BUDGET_MS = 1500
+# What `status` measures itself, from the first line of cli.py to its last print
+STATUS_BUDGET_MS = 300
+
+
+def run_cli(*args, root):
+    env = {**os.environ, "RUNNING_TRENDS_ROOT": str(root)}
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, SCRIPT, *args], env=env, capture_output=True, text=True, timeout=60)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def test_status_starts_within_budget(tmp_path):
+    result, elapsed_ms = run_cli("status", "--budget-ms", str(STATUS_BUDGET_MS), root=tmp_path)
+    assert result.returncode == 0, result.stderr
+    assert elapsed_ms < WALL_BUDGET_MS, f"status took {elapsed_ms:.0f} ms"
+
+
+def test_help_starts_within_budget(tmp_path):
+    result, elapsed_ms = run_cli("--help", root=tmp_path)
+    assert result.returncode == 0, result.stderr
+    assert "status" in result.stdout
+    assert elapsed_ms < WALL_BUDGET_MS, f"--help took {elapsed_ms:.0f} ms"
+
+
+def test_status_imports_no_heavy_modules(tmp_path):
+    code = ("import sys; sys.path.insert(0, 'src'); import cli; cli.main(['status']); "
+            "print(sorted(m for m in ('pandas', 'numpy', 'scipy', 'matplotlib', 'requests') if m in sys.modules))")
+    env = {**os.environ, "RUNNING_TRENDS_ROOT": str(tmp_path)}
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "[]"
@@ -0,0 +1,45 @@
+# Resolution of race `localidad` strings against a small excerpt of the INE municipality list.
+#
+#   python -m pytest tests
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from municipalities import MunicipalityIndex, read_municipalities  # noqa: E402
+
+FIXTURE = os.path.join(ROOT, "tests", "fixtures", "municipios-INE.csv")
+
+
+@pytest.fixture(scope="module")
+def index():
+    return MunicipalityIndex(read_municipalities(FIXTURE))
+
+
+def test_read_municipalities_pads_codes():
+    municipalities = read_municipalities(FIXTURE)
+    assert list(municipalities.columns) == ["cpro", "cmun", "municipio"]
+    assert municipalities.set_index("municipio").loc["Alcalá de Henares", "cmun"] == "28005"
+    assert municipalities["cpro"].str.len().eq(2).all()
+
+
+@pytest.mark.parametrize("localidad, cmun, method", [
+    ("Madrid, Madrid", "28079", "exact"),
+    ("Madrid, Las Rozas de Madrid", "28127", "exact"),        # article moved to the front
+    ("Alicante, Alacant", "03014", "exact"),                  # either name of a bilingual municipality
+    ("Cádiz, Costa Ballena (Chipiona)", "11016", "exact"),    # hamlet, municipality in brackets
+    ("Cadiz, Chipiona (Cádiz)", "11016", "exact"),            # province repeated in brackets
+    ("Chipiona", "11016", "exact"),                           # no province
+    ("Madrid, Alcala de Henarez", "28005", "fuzzy"),          # typo
+])
+def test_resolve(index, localidad, cmun, method):
+    assert index.resolve(localidad)[1:4:2] == (cmun, method)
+
+
+def test_resolve_misses(index):
+    assert index.resolve("Madrid, Navacerrada") == ("28", None, None, "province", 0.0)
+    assert index.resolve("Atlántida")[3] == "unresolved"